@@ -19,6 +19,43 @@ class Config(object):
     SQLALCHEMY_ECHO = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     LANGUAGE_MODEL_NAME = 'distiluse-base-multilingual-cased'
+    LANGUAGE_MODEL_QUANTIZE = False
+    LANGUAGE_MODEL_WAIT_SECONDS = 0
+    NORMALIZATION_CACHE_BYTES = 64 * 1024 * 1024
+    NORMALIZATION_CACHE_FLUSH_SECONDS = 5
+    NORMALIZATION_POOL_THRESHOLD = 2000
+    NORMALIZATION_POOL_SIZE = os.cpu_count() or 1
+    ENCODING_CACHE_BYTES = 256 * 1024 * 1024
+    ENCODING_CACHE_SIZE = 1000000
+    ENCODER_SERVICE = False
+    ENCODER_SOCKET = os.path.join(DATA_PATH, 'encoder.sock')
+    ENCODER_TIMEOUT = 30
+    ENCODE_BATCH_SIZE = 64
+    ENCODE_BATCH_WAIT_MS = 5
+    ASYNC_PORT = 5001
+    ASYNC_WORKER_THREADS = 32
+    HYBRID_LEXICAL_WEIGHT = 0.0
+    IVF_MIN_QUESTIONS = 20000
+    IVF_PROBES = 8
+    IVF_KMEANS_ITERATIONS = 10
+    QA_CONFLICT_THRESHOLD = 0.99
+    QA_IMPORT_BLOCK_SIZE = 1024
+    SUGGESTION_CLUSTER_THRESHOLD = 0.8
+    SUGGESTION_FLUSH_SECONDS = 5
+    SUGGESTION_FLUSH_EVENTS = 100
+    SUGGESTION_FLUSH_ATTEMPTS = 5
+    MESSAGE_JOURNAL_SIZE = 10000
+    MESSAGE_JOURNAL_BATCH_SIZE = 500
+    MESSAGE_JOURNAL_FLUSH_SECONDS = 1
+    MESSAGE_JOURNAL_PUT_TIMEOUT = 5
+    MESSAGE_JOURNAL_ATTEMPTS = 3
+    MESSAGE_JOURNAL_DEAD_LETTER = os.path.join(DATA_PATH, 'message_journal.dead')
+    EXPORT_BATCH_SIZE = 1000
+    HISTORY_PAGE_SIZE = 50
+    HISTORY_BUFFER_SIZE = 100
+    HISTORY_BUFFER_SESSIONS = 10000
+    HISTORY_BUFFER_TTL_SECONDS = 300
+    HISTORY_BUFFER_CHECK_SECONDS = 2
     LOGGING_CONF_FILE = 'logging.conf'
     LOGGER_NAME = 'easychatbot'
     LOG_LEVELS = {
@@ -1,5 +1,7 @@
 import os
+import time
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
 from flask import Flask, Blueprint
 from flask_sqlalchemy import SQLAlchemy
@@ -11,18 +13,20 @@ from logger import create_logger
 
 def create_app(config=None):
     app = Flask(__name__, instance_relative_config=True)
+    app.startup_timings = {}
 
-    config_name = os.getenv('FLASK_CONFIG', 'default')
-    app.config.from_object(configs[config_name])
+    with startup_phase(app, 'config'):
+        config_name = os.getenv('FLASK_CONFIG', 'default')
+        app.config.from_object(configs[config_name])
 
-    if config:
-        app.config.from_mapping(test_config)
-    else:
-        app.config.from_pyfile('config.py', silent=True)
+        if config:
+            app.config.from_mapping(config)
+        else:
+            app.config.from_pyfile('config.py', silent=True)
 
-    app.identifier = str(uuid.uuid4())
-    app.created = datetime.utcnow()
-    app.logger = create_logger(app.config)
+        app.identifier = str(uuid.uuid4())
+        app.created = datetime.utcnow()
+        app.logger = create_logger(app.config)
     
     login_manager =  LoginManager()
     login_manager.init_app(app)
@@ -32,32 +36,67 @@ def create_app(config=None):
 
     with app.app_context():
 
-        import easychatbot.database.models
-        db.create_all()
-
-        if app.env == 'development' and not easychatbot.database.models.User.query.count():
-            from easychatbot.database import mockdata
-            mockdata.create_mockdata()
-
-        from easychatbot.api import api
-        from easychatbot.api.endpoints.root import ns as root_namespace
-        from easychatbot.api.endpoints.users import ns as users_namespace
-        from easychatbot.api.endpoints.chatbot import ns as chatbot_namespace
-        from easychatbot.api.endpoints.qas import ns as qas_namespace
-        from easychatbot.api.endpoints.engine import ns as engine_namespace
-        from easychatbot.api.endpoints.statistics import ns as statistics_namespace
-
-        blueprint = Blueprint('api', __name__, url_prefix='/api')
-        api.init_app(blueprint)
-        api.add_namespace(root_namespace)
-        api.add_namespace(users_namespace)
-        api.add_namespace(chatbot_namespace)
-        api.add_namespace(qas_namespace)
-        api.add_namespace(engine_namespace)
-        api.add_namespace(statistics_namespace)
-        app.register_blueprint(blueprint)
-
-        from easychatbot import normalization
-        normalization.init_normalization()
+        with startup_phase(app, 'normalization'):
+            from easychatbot import normalization
+            normalization.init_normalization()
+
+        with startup_phase(app, 'database'):
+            import easychatbot.database.models
+            db.create_all()
+
+            if app.env == 'development' and not easychatbot.database.models.User.query.count():
+                from easychatbot.database import mockdata
+                mockdata.create_mockdata()
+
+            from easychatbot.database.models import Message, MessageDailyStats
+            # the backfill reads every stored message, so it is left to the backfill-statistics command
+            if not MessageDailyStats.query.first() and Message.query.first():
+                app.logger.warning('The daily statistics are empty, run `flask backfill-statistics` to build them')
+
+        with startup_phase(app, 'journal'):
+            from easychatbot import journal, history
+            history.init_history()
+            journal.init_journal()
+
+        with startup_phase(app, 'language_model'):
+            from easychatbot import language_model
+            language_model.init_language_model()
+
+        with startup_phase(app, 'suggestions'):
+            from easychatbot import suggestions
+            suggestions.init_suggestions()
+
+        with startup_phase(app, 'api'):
+            from easychatbot.api import api
+            from easychatbot.api.endpoints.root import ns as root_namespace
+            from easychatbot.api.endpoints.users import ns as users_namespace
+            from easychatbot.api.endpoints.chatbot import ns as chatbot_namespace
+            from easychatbot.api.endpoints.qas import ns as qas_namespace
+            from easychatbot.api.endpoints.engine import ns as engine_namespace
+            from easychatbot.api.endpoints.statistics import ns as statistics_namespace
+            from easychatbot.api.endpoints.export import ns as export_namespace
+
+            blueprint = Blueprint('api', __name__, url_prefix='/api')
+            api.init_app(blueprint)
+            api.add_namespace(root_namespace)
+            api.add_namespace(users_namespace)
+            api.add_namespace(chatbot_namespace)
+            api.add_namespace(qas_namespace)
+            api.add_namespace(engine_namespace)
+            api.add_namespace(statistics_namespace)
+            api.add_namespace(export_namespace)
+            app.register_blueprint(blueprint)
+
+            from easychatbot.cli import register_commands
+            register_commands(app)
+
+    app.logger.info(f'Started in {sum(app.startup_timings.values()):.3f}s: {app.startup_timings}')
 
     return app
+
+
+@contextmanager
+def startup_phase(app, name):
+    started = time.perf_counter()
+    yield
+    app.startup_timings[name] = round(time.perf_counter() - started, 3)
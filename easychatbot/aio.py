@@ -0,0 +1,139 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from flask import current_app as app
+from flask import request, session
+from flask_restplus import marshal
+from flask_login import current_user
+from werkzeug.test import EnvironBuilder
+from easychatbot.api import api
+from easychatbot.api.serializers import message, answer_message, questions
+from easychatbot.api.endpoints.engine import Answer, History, check_top, answer_questions, store_answers, \
+    load_history
+from easychatbot.normalization import normalize_single, normalize_multiple
+
+
+# The chat endpoints served from an asyncio event loop. A request only takes a worker thread for the steps that block,
+# reading the session and the user, normalization, the encoding and matching, the journal write and the rendering of
+# the response, and gives it back in between, so idle and waiting connections hold no thread. Every step runs in a
+# request context of the flask application, the session is carried from step to step and the responses are rendered
+# by the api, so requests and responses are the same as on the WSGI server.
+def create_aio_app(flask_app):
+    aio_app = web.Application(middlewares=[error_middleware])
+    aio_app['flask_app'] = flask_app
+    aio_app['executor'] = ThreadPoolExecutor(flask_app.config['ASYNC_WORKER_THREADS'],
+                                             thread_name_prefix='async-worker')
+    aio_app.router.add_get('/api/engine/answer', get_answer)
+    aio_app.router.add_post('/api/engine/answers', post_answers)
+    aio_app.router.add_get('/api/engine/history', get_history)
+    aio_app.on_startup.append(start_executor)
+    aio_app.on_shutdown.append(shutdown_executor)
+    return aio_app
+
+
+async def start_executor(aio_app):
+    # the executor starts its threads on demand, which waits on the event loop, so all of them are started up front
+    barrier = threading.Barrier(aio_app['flask_app'].config['ASYNC_WORKER_THREADS'])
+    await asyncio.gather(*[asyncio.get_event_loop().run_in_executor(aio_app['executor'], barrier.wait)
+                           for _ in range(barrier.parties)])
+
+
+async def shutdown_executor(aio_app):
+    aio_app['executor'].shutdown(wait=True)
+
+
+async def get_answer(aio_request):
+    chat = ChatRequest(aio_request, await aio_request.read())
+    user, question, normalized_question, top = await chat.run(parse_question)
+    rows, answers = await chat.run(answer_questions, *user, [question], [normalized_question], top)
+    await chat.run(store_answers, rows)
+    return await chat.respond(answers[0], answer_message)
+
+
+async def post_answers(aio_request):
+    chat = ChatRequest(aio_request, await aio_request.read())
+    user, questions, normalized_questions, top = await chat.run(parse_questions)
+    rows, answers = await chat.run(answer_questions, *user, questions, normalized_questions, top)
+    await chat.run(store_answers, rows)
+    return await chat.respond(answers, answer_message)
+
+
+async def get_history(aio_request):
+    chat = ChatRequest(aio_request, await aio_request.read())
+    messages = await chat.run(read_history)
+    return await chat.respond(messages, message)
+
+
+def parse_question():
+    user = load_user()
+    args = Answer.parser.parse_args()
+    top = check_top(args.top)
+    return user, args.question, normalize_single(args.question) if args.question else None, top
+
+
+def parse_questions():
+    user = load_user()
+    questions.validate(request.json)
+    top = check_top(request.json.get('top'))
+    return user, request.json['questions'], normalize_multiple(request.json['questions']), top
+
+
+def read_history():
+    user = load_user()
+    args = History.parser.parse_args()
+    return load_history(user[0], args.limit, args.before, args.after)
+
+
+def load_user():
+    if not current_user.is_authenticated:
+        app.login_manager.unauthorized()
+    return session['id'], current_user.chatbot_id, current_user.id
+
+
+class ChatRequest:
+    def __init__(self, aio_request, body):
+        self.flask_app = aio_request.app['flask_app']
+        self.executor = aio_request.app['executor']
+        self.environ = EnvironBuilder(path=aio_request.path, base_url=f'{aio_request.scheme}://{aio_request.host}',
+                                      query_string=aio_request.query_string, method=aio_request.method,
+                                      headers=list(aio_request.headers.items()), data=body,
+                                      environ_base={'REMOTE_ADDR': aio_request.remote}).get_environ()
+        self.session = None
+
+    async def run(self, fn, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor, self.__call, fn, args)
+
+    async def respond(self, data, model):
+        return await self.run(lambda: self.__to_response(api.make_response(marshal(data, model), 200)))
+
+    def __call(self, fn, args):
+        context = self.flask_app.request_context(self.environ)
+        context.session = self.session
+        with context:
+            if self.session is None:
+                # the first step opens the session, like the WSGI server it runs the before request handlers once
+                self.session = context.session
+                self.flask_app.preprocess_request()
+            try:
+                return fn(*args)
+            except Exception as e:
+                raise ErrorResponse(self.__to_response(api.handle_error(e)))
+
+    def __to_response(self, response):
+        response = self.flask_app.process_response(response)
+        headers = [(name, value) for name, value in response.headers if name.lower() != 'content-length']
+        return web.Response(body=response.get_data(), status=response.status_code, headers=headers)
+
+
+class ErrorResponse(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+@web.middleware
+async def error_middleware(aio_request, handler):
+    try:
+        return await handler(aio_request)
+    except ErrorResponse as e:
+        return e.response
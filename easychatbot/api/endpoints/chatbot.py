@@ -6,6 +6,7 @@ from easychatbot.api import api
 from easychatbot.api.serializers import chatbot
 from easychatbot.database import db
 from easychatbot.database.models import Chatbot
+from easychatbot.index import invalidate_index
 
 
 ns = api.namespace('chatbot', description='Operations regarding the chatbot object')
@@ -55,6 +56,8 @@ class ChatbotItem(Resource):
         
         chatbot = Chatbot.query.filter_by(id=current_user.chatbot_id).one()
         chatbot = to_db_model(request.json, chatbot)
+        if any(key in request.json for key in ('index_type', 'index_probes', 'index_precision', 'index_dimensions')):
+            invalidate_index(chatbot.id)
         db.session.commit()
 
         return to_view_model(chatbot), 200
@@ -72,6 +75,22 @@ def to_db_model(data, chatbot = None):
         chatbot.welcome_messages = json.dumps(data['welcome_messages'])
     if 'no_answer_messages' in data:
         chatbot.no_answer_messages = json.dumps(data['no_answer_messages'])
+    if 'index_type' in data:
+        if data['index_type'] not in ('auto', 'exact', 'ivf'):
+            return abort(400, 'index_type must be one of auto, exact or ivf.')
+        chatbot.index_type = data['index_type']
+    if 'index_probes' in data:
+        if data['index_probes'] is not None and data['index_probes'] < 1:
+            return abort(400, 'index_probes must be a positive integer.')
+        chatbot.index_probes = data['index_probes']
+    if 'index_precision' in data:
+        if data['index_precision'] not in ('float32', 'float16', 'int8'):
+            return abort(400, 'index_precision must be one of float32, float16 or int8.')
+        chatbot.index_precision = data['index_precision']
+    if 'index_dimensions' in data:
+        if data['index_dimensions'] is not None and data['index_dimensions'] < 1:
+            return abort(400, 'index_dimensions must be a positive integer.')
+        chatbot.index_dimensions = data['index_dimensions']
     return chatbot
 
 
@@ -82,4 +101,8 @@ def to_view_model(chatbot):
     data['match_threshold'] = chatbot.match_threshold
     data['welcome_messages'] = json.loads(chatbot.welcome_messages)
     data['no_answer_messages'] = json.loads(chatbot.no_answer_messages)
+    data['index_type'] = chatbot.index_type
+    data['index_probes'] = chatbot.index_probes
+    data['index_precision'] = chatbot.index_precision
+    data['index_dimensions'] = chatbot.index_dimensions
     return data
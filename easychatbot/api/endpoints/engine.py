@@ -1,13 +1,16 @@
+from flask import current_app as app
 from flask import request, abort, session, g
 from flask_restplus import Resource, reqparse
 from flask_login import login_required, current_user
 from easychatbot.api import api
-from easychatbot.api.serializers import chatbot, message
+from easychatbot.api.serializers import chatbot, message, answer_message, questions
 from easychatbot.database import db
-from easychatbot.database.models import Chatbot, Message
+from easychatbot.database.models import Chatbot, Message, Question
 from easychatbot.engine import Engine 
-from easychatbot.normalization import normalize_single 
+from easychatbot.normalization import normalize_single, normalize_multiple
 from easychatbot.suggestions import handle_suggestion
+from easychatbot.journal import new_message, journal_messages, get_pending_messages
+from easychatbot import history
 
 
 ns = api.namespace('engine', description='Enpoints for chatbot interaction')
@@ -19,45 +22,164 @@ class Answer(Resource):
     parser = reqparse.RequestParser()
     parser.add_argument('question', type=str, required=False, 
         help='The question to ask. When not provided, a welcome message will be returned.')
+    parser.add_argument('top', type=int, required=False, default=0,
+        help='The number of best matching QAs to return as alternatives.')
 
     @api.expect(parser)
-    @api.marshal_with(message)
+    @api.marshal_with(answer_message)
+    @api.response(400, 'Invalid top provided.')
     @api.response(404, 'Chatbot not found.')
     @login_required
     def get(self):
         """Ask a question to the chatbot"""
 
         args = self.parser.parse_args()
+        top = check_top(args.top)
+        normalized_question = normalize_single(args.question) if args.question else None
+        rows, answers = answer_questions(session['id'], current_user.chatbot_id, current_user.id,
+                                         [args.question], [normalized_question], top)
+        store_answers(rows)
+        return answers[0], 200
 
-        if args.question:
-            message = Message(session_id=session['id'], chatbot_id=current_user.chatbot_id, 
-                              user_id=current_user.id, text=args.question, 
-                              normalized_text=normalize_single(args.question))
-            db.session.add(message)
 
-        answer, score, is_welcome, is_no_answer = Engine(current_user.chatbot_id).get_answer(args.question)
+@ns.route('/answers')
+class Answers(Resource):
 
-        if not is_welcome: 
-            handle_suggestion(current_user.chatbot_id, args.question, score, is_no_answer)
-
-        message = Message(session_id=session['id'], chatbot_id=current_user.chatbot_id, 
-                          user_id=current_user.id, text=answer, score=score, 
-                          is_welcome=is_welcome, is_no_answer=is_no_answer)
-        db.session.add(message)
-
-        db.session.commit()
+    @api.expect(questions)
+    @api.marshal_with(answer_message, as_list=True)
+    @api.response(400, 'Invalid top provided.')
+    @api.response(404, 'Chatbot not found.')
+    @login_required
+    def post(self):
+        """Ask multiple questions to the chatbot at once"""
 
-        return { 'text': message.text, 'is_bot_message': True, 'date': message.created }, 200
+        questions = request.json['questions']
+        top = check_top(request.json.get('top'))
+        normalized_questions = normalize_multiple(questions)
+        rows, answers = answer_questions(session['id'], current_user.chatbot_id, current_user.id,
+                                         questions, normalized_questions, top)
+        store_answers(rows)
+        return answers, 200
 
 
 @ns.route('/history')
 class History(Resource):
 
+    parser = reqparse.RequestParser()
+    parser.add_argument('before', type=int, required=False,
+        help='Only return messages with an id lower than this id, the latest messages before it.')
+    parser.add_argument('after', type=int, required=False,
+        help='Only return messages with an id higher than this id, the earliest messages after it.')
+    parser.add_argument('limit', type=int, required=False,
+        help='The maximum number of messages to return.')
+
+    @api.expect(parser)
     @api.marshal_with(message, as_list=True)
+    @api.response(400, 'Invalid cursor provided.')
     @login_required
     def get(self):
         """Get the session history of messages from the user and chatbot"""
 
-        messages = Message.query.filter_by(session_id=session['id'])
-        messages = [{'text': m.text, 'is_bot_message': bool(m.score), 'date': m.created} for m in messages]
-        return messages, 200
\ No newline at end of file
+        args = self.parser.parse_args()
+        return load_history(session['id'], args.limit, args.before, args.after), 200
+
+
+def check_top(top):
+    if top is not None and top < 0:
+        return abort(400, 'top must not be negative.')
+    return top or 0
+
+
+def answer_questions(session_id, chatbot_id, user_id, questions, normalized_questions, top):
+    question_rows = [new_message(session_id, chatbot_id, user_id, question, normalized_question) if question else None
+                     for question, normalized_question in zip(questions, normalized_questions)]
+
+    answers = Engine(chatbot_id).get_answers(questions, normalized_questions, top)
+
+    rows, messages = [], []
+    for question_row, (answer, score, is_welcome, is_no_answer, results) in zip(question_rows, answers):
+        message = new_message(session_id, chatbot_id, user_id, answer,
+                              score=score, is_welcome=is_welcome, is_no_answer=is_no_answer)
+        rows += [question_row, message] if question_row else [message]
+        messages.append((message, results))
+
+    first_questions = load_first_questions([results[:top] for _, results in messages])
+    return rows, [{ 'text': message['text'], 'is_bot_message': True, 'date': message['created'], 
+                    'alternatives': to_alternatives(results, top, first_questions) }
+                  for message, results in messages]
+
+
+def store_answers(rows):
+    # the questions are only stored together with their answers, a failed request leaves neither in the history
+    journal_messages(rows)
+    # every answer but a welcome message directly follows its question
+    for question, answer in zip([None] + rows, rows):
+        if answer['score'] is not None and not answer['is_welcome']:
+            handle_suggestion(answer['chatbot_id'], question['text'], question['normalized_text'],
+                              answer['score'], answer['is_no_answer'])
+
+
+def load_history(session_id, limit, before=None, after=None):
+    limit = limit or app.config['HISTORY_PAGE_SIZE']
+    if limit < 1:
+        return abort(400, 'limit must be a positive integer.')
+    if before is not None and after is not None:
+        return abort(400, 'before and after can not be combined.')
+
+    if before is not None:
+        messages = load_messages(session_id, limit, before=before)
+    else:
+        messages = history.history_buffer.latest(session_id, limit, after,
+                                                 lambda last_id: load_message_ids(session_id, last_id)) \
+            if history.history_buffer else None
+        if messages is None:
+            messages = load_latest_messages(session_id, limit, after)
+
+    return [{'id': m['id'], 'text': m['text'], 'is_bot_message': m['score'] is not None, 'date': m['created']}
+            for m in messages]
+
+
+def load_messages(session_id, limit, before=None, after=None):
+    query = Message.query\
+        .with_entities(Message.id, Message.text, Message.score, Message.created)\
+        .filter_by(session_id=session_id)
+    if after is not None:
+        messages = query.filter(Message.id > after).order_by(Message.id).limit(limit).all()
+    else:
+        if before is not None:
+            query = query.filter(Message.id < before)
+        messages = reversed(query.order_by(Message.id.desc()).limit(limit).all())
+    return [m._asdict() for m in messages]
+
+
+def load_message_ids(session_id, after):
+    return [id for id, in Message.query.with_entities(Message.id).filter_by(session_id=session_id)
+            .filter(Message.id > after)]
+
+
+def load_latest_messages(session_id, limit, after=None):
+    # pending messages are read first, a message committed in between is then also found in the database
+    pending = get_pending_messages(session_id)
+    if after is None:
+        messages = load_messages(session_id, max(limit, app.config['HISTORY_BUFFER_SIZE']))
+    else:
+        messages = load_messages(session_id, limit, after=after)
+
+    stored = set((m['created'], m['text']) for m in messages)
+    messages += [m for m in pending if (m['created'], m['text']) not in stored]
+    if after is None and history.history_buffer:
+        history.history_buffer.seed(session_id, messages, lambda: get_pending_messages(session_id))
+    return messages[-limit:] if after is None else messages[:limit]
+
+
+def to_alternatives(results, top, first_questions):
+    return [{'qa_id': qa.id, 'question': first_questions.get(qa.id), 'score': score}
+            for qa, score in results[:top or 0]]
+
+
+def load_first_questions(results):
+    qa_ids = set(qa.id for result in results for qa, _ in result)
+    if not qa_ids:
+        return {}
+    first_ids = db.session.query(db.func.min(Question.id)).filter(Question.qa_id.in_(qa_ids)).group_by(Question.qa_id)
+    return dict(db.session.query(Question.qa_id, Question.text).filter(Question.id.in_(first_ids)).all())
@@ -0,0 +1,102 @@
+import csv
+import datetime
+import io
+import json
+import zlib
+from flask import current_app as app
+from flask import request, Response, stream_with_context
+from flask_restplus import Resource, reqparse, inputs
+from flask_login import login_required, current_user
+from easychatbot.api import api
+from easychatbot.api.parsers import date_interval_parser, parse_date_interval
+from easychatbot.database.models import Message
+
+
+ns = api.namespace('export', description='Endpoints to export chatbot data')
+
+
+EXPORT_COLUMNS = ['id', 'session_id', 'user_id', 'text', 'normalized_text', 'score', 'is_welcome',
+                  'is_no_answer', 'created']
+
+
+@ns.route('/messages')
+class MessagesExport(Resource):
+
+    parser = date_interval_parser.copy()
+    parser.add_argument('format', type=str, required=False, default='ndjson', choices=('ndjson', 'csv'),
+                        help='The export format, one json object per line or csv with a header.')
+    parser.add_argument('gzip', type=inputs.boolean, required=False, default=False,
+                        help='Whether to compress the export with gzip.')
+
+    @api.expect(parser)
+    @api.response(200, 'The messages of the chatbot, streamed in the requested format.')
+    @api.response(400, 'Invalid date interval provided.')
+    @api.response(401, 'You are not authorized or logged in.')
+    @login_required
+    def get(self):
+        """Export all messages of the chatbot"""
+
+        args = self.parser.parse_args(request)
+        date_from, date_to = parse_date_interval(args)
+        lines = to_ndjson if args['format'] == 'ndjson' else to_csv
+        chunks = lines(iterate_messages(current_user.chatbot_id, date_from, date_to, app.config['EXPORT_BATCH_SIZE']))
+
+        filename = f'messages.{args["format"]}'
+        mimetype = 'application/x-ndjson' if args['format'] == 'ndjson' else 'text/csv'
+        if args['gzip']:
+            chunks, filename, mimetype = compress(chunks), filename + '.gz', 'application/gzip'
+
+        return Response(stream_with_context(chunks), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+def iterate_messages(chatbot_id, date_from, date_to, batch_size):
+    columns = [getattr(Message, column) for column in EXPORT_COLUMNS]
+    query = Message.query.with_entities(*columns).filter_by(chatbot_id=chatbot_id)
+    if date_from is not None:
+        query = query.filter(Message.created >= date_from)
+    if date_to is not None:
+        query = query.filter(Message.created < date_to + datetime.timedelta(days=1))
+
+    # keyset pagination on the primary key keeps every batch an index range scan, whatever the offset
+    last_id = 0
+    while True:
+        messages = query.filter(Message.id > last_id).order_by(Message.id).limit(batch_size).all()
+        if not messages:
+            return
+        yield messages
+        last_id = messages[-1].id
+
+
+def to_ndjson(batches):
+    for messages in batches:
+        yield ''.join(json.dumps(to_row(m)) + '\n' for m in messages).encode('utf-8')
+
+
+def to_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for messages in batches:
+        # the rows are selected in the order of EXPORT_COLUMNS
+        writer.writerows(to_row(m).values() for m in messages)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def compress(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def to_row(message):
+    row = message._asdict()
+    row['created'] = row['created'].isoformat() if row['created'] else None
+    return row
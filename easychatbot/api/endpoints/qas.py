@@ -1,13 +1,16 @@
+import csv
+import io
 import itertools
 from flask import request, abort
 from flask_restplus import Resource, reqparse
 from flask_login import login_required, current_user
 from easychatbot.api import api
 from easychatbot.api.parsers import pagination_parser
-from easychatbot.api.serializers import qa, suggestion
+from easychatbot.api.serializers import qa, suggestion, qa_import_result
 from easychatbot.database import db
 from easychatbot.database.models import QA, Question, Answer
-from easychatbot.engine import Engine
+from easychatbot.index import invalidate_index
+from easychatbot.importer import import_qas, find_conflicts
 from easychatbot.suggestions import get_question_suggestions
 
 
@@ -29,10 +32,15 @@ class QACollection(Resource):
         page = args.get('page', 1)
         page_size = args.get('page_size', 20)
 
-        qas = QA.query.filter_by(chatbot_id=current_user.chatbot_id)\
-            .join(Question).join(Answer).paginate(page, page_size, error_out=False)
+        qas = QA.query\
+            .with_entities(QA.id)\
+            .filter_by(chatbot_id=current_user.chatbot_id)\
+            .order_by(QA.id)\
+            .offset((max(page, 1) - 1) * page_size)\
+            .limit(page_size)\
+            .all()
         
-        return [to_view_model(qa) for qa in qas.items], 200
+        return to_view_models([qa.id for qa in qas]), 200
 
     @api.expect(qa)
     @api.marshal_with(qa)
@@ -43,21 +51,44 @@ class QACollection(Resource):
     def post(self):
         """Create a new QA"""
 
-        engine = Engine(current_user.chatbot_id)
-        for question in request.json['questions']:
-            qa, score = engine.get_qa(question)
-            if score > 0.99:
-                raise abort(409, f'A conflicting qa exists: {qa.id}')
+        conflicts = find_conflicts(current_user.chatbot_id, request.json['questions'])
+        if conflicts:
+            raise abort(409, f'A conflicting qa exists: {conflicts[0]["qa_id"]}')
 
         qa = QA(chatbot_id=current_user.chatbot_id)
         db.session.add(qa)
         db.session.flush()
         qa = to_db_model(request.json, qa)
+        invalidate_index(current_user.chatbot_id)
         db.session.commit()
 
         return to_view_model(qa), 200
 
 
+@ns.route('/import')
+class QAImport(Resource):
+
+    @api.expect([qa], validate=False)
+    @api.marshal_with(qa_import_result, as_list=True)
+    @api.response(400, 'Invalid import data provided.')
+    @api.response(401, 'You are not authorized or logged in.')
+    @api.response(404, 'Chatbot not found.')
+    @login_required
+    def post(self):
+        """Import QAs in bulk from a json list, or a csv file uploaded as file or posted as text/csv"""
+
+        if 'file' in request.files:
+            items = parse_csv(request.files['file'].read())
+        elif request.mimetype == 'text/csv':
+            items = parse_csv(request.get_data())
+        else:
+            items = request.get_json(silent=True)
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                return abort(400, 'Expected a json list of QAs or a csv file.')
+
+        return import_qas(current_user.chatbot_id, items), 200
+
+
 @ns.route('/<int:id>')
 class QAItem(Resource):
 
@@ -68,7 +99,7 @@ class QAItem(Resource):
     def get(self, id):
         """Get a QA"""
         
-        qa = QA.query.filter_by(chatbot_id=current_user.chatbot_id, id=id).one()
+        qa = QA.query.with_entities(QA.id).filter_by(chatbot_id=current_user.chatbot_id, id=id).one()
 
         return to_view_model(qa), 200
  
@@ -81,14 +112,13 @@ class QAItem(Resource):
     def put(self, id):
         """Update a QA"""
         
-        engine = Engine(current_user.chatbot_id)
-        for question in request.json['questions']:
-            qa, score = engine.get_qa(question)
-            if qa.id != id and score > 0.99:
-                raise abort(409, qa.id)
+        conflicts = find_conflicts(current_user.chatbot_id, request.json['questions'], exclude_qa_id=id)
+        if conflicts:
+            raise abort(409, conflicts[0]['qa_id'])
 
         qa = QA.query.filter_by(chatbot_id=current_user.chatbot_id, id=id).one()
         qa = to_db_model(request.json, qa)
+        invalidate_index(current_user.chatbot_id)
         db.session.commit()
 
         return to_view_model(qa), 200
@@ -105,6 +135,7 @@ class QAItem(Resource):
         questions = Question.query.filter_by(qa_id=qa.id).delete()
         answers = Answer.query.filter_by(qa_id=qa.id).delete()
         db.session.delete(qa)
+        invalidate_index(current_user.chatbot_id)
         db.session.commit()
 
         return None, 204
@@ -116,6 +147,8 @@ class Suggestions(Resource):
     parser = reqparse.RequestParser()
     parser.add_argument('questions', type=str, action='append', required=False, help='Already existing questions')
     parser.add_argument('top', type=int, required=False, default=10, help='The number of results.')
+    parser.add_argument('aggregation', type=str, required=False, default='max', choices=('max', 'mean'),
+                        help='How the similarities to multiple questions are combined.')
 
     @api.expect(parser)
     @api.marshal_with(suggestion, as_list=True)
@@ -129,12 +162,32 @@ class Suggestions(Resource):
         questions = args.get('questions', [])
         top = args.get('top', 10)
 
-        suggestions = get_question_suggestions(current_user.chatbot_id, questions)
-        suggestions = [{'text': text, 'score': score} for text, score in suggestions[:top]]
+        suggestions = get_question_suggestions(current_user.chatbot_id, questions, top, args.get('aggregation', 'max'))
+        suggestions = [{'text': text, 'score': score, 'count': count} for text, score, count in suggestions]
 
         return suggestions, 200
 
 
+# every csv row is a qa, the columns starting with question are its questions and those starting with answer its answers
+def parse_csv(data):
+    try:
+        rows = list(csv.reader(io.StringIO(data.decode('utf-8-sig'))))
+    except (UnicodeDecodeError, csv.Error) as e:
+        return abort(400, f'Invalid csv file: {e}')
+    if not rows:
+        return []
+
+    header = [column.strip().lower() for column in rows[0]]
+    question_columns = [idx for idx, column in enumerate(header) if column.startswith('question')]
+    answer_columns = [idx for idx, column in enumerate(header) if column.startswith('answer')]
+    if not question_columns or not answer_columns:
+        return abort(400, 'The csv header needs question and answer columns.')
+
+    return [{'questions': [row[idx].strip() for idx in question_columns if idx < len(row) and row[idx].strip()],
+             'answers': [row[idx].strip() for idx in answer_columns if idx < len(row) and row[idx].strip()]}
+            for row in rows[1:] if any(value.strip() for value in row)]
+
+
 def to_db_model(data, qa):
     existing_questions = Question.query.filter_by(qa_id=qa.id).all()
     for existing_question, text in itertools.zip_longest(existing_questions, data['questions']):
@@ -158,10 +211,28 @@ def to_db_model(data, qa):
 
 
 def to_view_model(qa):
-    data = {}
-    data['id'] = qa.id
-    questions = Question.query.with_entities(Question.text).filter_by(qa_id=qa.id).all()
-    data['questions'] = [q.text for q in questions]
-    answers = Answer.query.with_entities(Answer.text).filter_by(qa_id=qa.id).all()
-    data['answers'] = [a.text for a in answers]
-    return data
\ No newline at end of file
+    return to_view_models([qa.id])[0]
+
+
+def to_view_models(qa_ids):
+    data = {qa_id: {'id': qa_id, 'questions': [], 'answers': []} for qa_id in qa_ids}
+    if not data:
+        return []
+
+    questions = Question.query\
+        .with_entities(Question.qa_id, Question.text)\
+        .filter(Question.qa_id.in_(qa_ids))\
+        .order_by(Question.qa_id, Question.id)\
+        .all()
+    for q in questions:
+        data[q.qa_id]['questions'].append(q.text)
+
+    answers = Answer.query\
+        .with_entities(Answer.qa_id, Answer.text)\
+        .filter(Answer.qa_id.in_(qa_ids))\
+        .order_by(Answer.qa_id, Answer.id)\
+        .all()
+    for a in answers:
+        data[a.qa_id]['answers'].append(a.text)
+
+    return [data[qa_id] for qa_id in qa_ids]
\ No newline at end of file
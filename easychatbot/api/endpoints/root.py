@@ -2,8 +2,9 @@ import json
 import psutil
 from flask import current_app as app
 from flask_restplus import Resource
+from easychatbot import language_model, normalization, index, suggestions, journal, history
 from easychatbot.api import api
-from easychatbot.api.serializers import status
+from easychatbot.api.serializers import status, metrics, readiness
 
 
 ns = api.namespace('/', description='Generic endpoints')
@@ -20,4 +21,38 @@ class Status(Resource):
             "identifier": app.identifier,
             "created": app.created,
             "memory_mb": int(psutil.Process().memory_info().rss / 1000000),
-        }, 200
\ No newline at end of file
+        }, 200
+
+
+@ns.route('/ready')
+class Ready(Resource):
+
+    @api.marshal_with(readiness)
+    @api.response(503, 'The application is live but the language model is not loaded yet.')
+    def get(self):
+        """Readiness of the application to answer questions"""
+
+        ready = language_model.ready.is_set() and language_model.encoder is not None
+        return {
+            "live": True,
+            "ready": ready,
+            "startup_timings": app.startup_timings,
+        }, 200 if ready else 503
+
+
+@ns.route('/metrics')
+class Metrics(Resource):
+
+    @api.marshal_with(metrics)
+    def get(self):
+        """Performance counters of the application subsystems"""
+
+        return {
+            "encoder": language_model.encoder.stats() if language_model.encoder else {},
+            "matching": dict(index.counters),
+            "normalization_cache": normalization.normalization_cache.stats(),
+            "encoding_cache": language_model.encoding_memory_cache.stats(),
+            "suggestions": suggestions.suggestion_aggregator.stats() if suggestions.suggestion_aggregator else {},
+            "message_journal": journal.message_journal.stats() if journal.message_journal else {},
+            "history_buffer": history.history_buffer.stats() if history.history_buffer else {},
+        }, 200
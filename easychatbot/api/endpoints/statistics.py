@@ -1,16 +1,13 @@
 import datetime
-import json
-import itertools
-import pandas as pd
-import numpy as np
 from flask import request, abort
 from flask_restplus import Resource, reqparse
 from flask_login import login_required, current_user
 from easychatbot.api import api
-from easychatbot.api.parsers import pagination_parser
+from easychatbot.api.parsers import pagination_parser, date_interval_parser, parse_date_interval
 from easychatbot.api.serializers import qa_statistics, chatbot_statistics, chatbot_statistics_dict
 from easychatbot.database import db
-from easychatbot.database.models import QA, Question, Answer, Message
+from easychatbot.database.models import QA, Question, Answer
+from easychatbot.daily_stats import get_daily_stats, summarize_daily_stats
 
 
 ns = api.namespace('statistics', description='Endpoints to retrieve statistics')
@@ -37,24 +34,27 @@ class QAStatistics(Resource):
 @ns.route('/chatbot')
 class ChatbotStatistics(Resource):
 
+    @api.expect(date_interval_parser)
     @api.marshal_with(chatbot_statistics)
+    @api.response(400, 'Invalid date interval provided.')
     @api.response(401, 'You are not authorized or logged in.')
     @api.response(404, 'Chatbot not found.')
     @login_required
     def get(self):
         """Get statistics about the Chatbot interactions"""
 
-        messages = Message.query.filter_by(chatbot_id=current_user.chatbot_id).all()
-        df = pd.DataFrame(get_chatbot_stats_input(messages))
+        date_from, date_to = parse_date_interval(date_interval_parser.parse_args(request))
+        daily_stats = get_daily_stats(current_user.chatbot_id, date_from, date_to)
 
-        return get_chatbot_stats_output(df), 200
+        return summarize_daily_stats(daily_stats), 200
 
 
 @ns.route('/chatbot/day')
 class ChatbotStatisticsPerDay(Resource):
     
-    @api.expect(pagination_parser)
+    @api.expect(pagination_parser, date_interval_parser)
     @api.marshal_with(chatbot_statistics_dict)
+    @api.response(400, 'Invalid date interval provided.')
     @api.response(401, 'You are not authorized or logged in.')
     @api.response(404, 'Chatbot not found.')
     @login_required
@@ -64,45 +64,16 @@ class ChatbotStatisticsPerDay(Resource):
         args = pagination_parser.parse_args(request)
         page = args.get('page', 1)
         page_size = args.get('page_size', 20)
-        date_from = datetime.date.today() + datetime.timedelta(days=1-page*page_size)
-        date_to = datetime.date.today() + datetime.timedelta(days=1-(page-1)*page_size)
-
-        messages = Message.query\
-            .filter_by(chatbot_id=current_user.chatbot_id)\
-            .filter(Message.created.between(date_from, date_to))\
-            .all()
-        df = pd.DataFrame(get_chatbot_stats_input(messages))
-        df = df.groupby(pd.PeriodIndex(data=df.date, freq='D')).apply(lambda x: get_chatbot_stats_output(x))
-        df = df.reindex(pd.period_range(date_from, date_to - datetime.timedelta(days=1)), fill_value=get_chatbot_stats_output())
-        df.index = df.index.astype(str)
-
-        return df.to_dict(), 200
-
-
-def get_chatbot_stats_input(messages):
-    return {
-        'date': [pd.to_datetime(m.created) for m in messages],
-        'user_id': [m.user_id for m in messages],
-        'session_id': [m.session_id for m in messages],
-        'score': [m.score for m in messages],
-        'is_welcome': [m.is_welcome for m in messages],
-        'is_no_answer': [m.is_no_answer for m in messages]
-    }
-
-
-def get_chatbot_stats_output(df=None):
-    if df is None:
-        return { 'user_count': 0, 'session_count': 0, 'total_msg_count': 0,
-                 'bot_msg_count': 0, 'user_msg_count': 0, 'accuracy': 0, 'match_score': 0 }
-
-    total_msg_count = len(df.index)
-    bot_msg_count = int(df['score'].count())
-    return {
-        'user_count': df['user_id'].nunique(),
-        'session_count': df['session_id'].nunique(),
-        'total_msg_count': total_msg_count,
-        'bot_msg_count': bot_msg_count,
-        'user_msg_count': total_msg_count - bot_msg_count,
-        'accuracy': 100.0 - (int(df['is_no_answer'].sum()) / bot_msg_count) * 100,
-        'match_score': df['score'].mean()
-    }
\ No newline at end of file
+        date_from, date_to = parse_date_interval(date_interval_parser.parse_args(request))
+        if date_from is None or date_to is None:
+            today = datetime.datetime.utcnow().date()
+            date_to = date_to or (date_from + datetime.timedelta(days=page_size - 1) if date_from else
+                                  today - datetime.timedelta(days=(page - 1) * page_size))
+            date_from = date_from or date_to - datetime.timedelta(days=page_size - 1)
+
+        daily_stats = {s.day: s for s in get_daily_stats(current_user.chatbot_id, date_from, date_to)}
+        days = (date_from + datetime.timedelta(days=i) for i in range((date_to - date_from).days + 1))
+
+        return {str(day): summarize_daily_stats([daily_stats[day]] if day in daily_stats else [])
+                for day in days}, 200
+
@@ -1,3 +1,5 @@
+import datetime
+from flask import abort
 from flask_restplus import reqparse
 
 pagination_parser = reqparse.RequestParser()
@@ -7,3 +9,14 @@ pagination_parser.add_argument('page_size', type=int, required=False, default=20
 date_interval_parser = reqparse.RequestParser()
 date_interval_parser.add_argument('date_from', type=str, required=False, default=None, help='The start date of the interval.')
 date_interval_parser.add_argument('date_to', type=str, required=False, default=None, help='The end date of the interval.')
+
+
+def parse_date_interval(args):
+    try:
+        date_from = datetime.date.fromisoformat(args['date_from']) if args.get('date_from') else None
+        date_to = datetime.date.fromisoformat(args['date_to']) if args.get('date_to') else None
+    except ValueError:
+        return abort(400, 'date_from and date_to must be dates formatted as YYYY-MM-DD.')
+    if date_from and date_to and date_from > date_to:
+        return abort(400, 'date_from must not be after date_to.')
+    return date_from, date_to
@@ -16,6 +16,24 @@ status = api.model('Status', {
                                 example=632)
 })
 
+readiness = api.model('Readiness', {
+    'live': fields.Boolean(readOnly=True,
+                           description='Whether the application is running and serving requests',
+                           example=True),
+    'ready': fields.Boolean(readOnly=True,
+                            description='Whether the language model is loaded and questions can be answered',
+                            example=True),
+    'startup_timings': fields.Raw(readOnly=True,
+                                  description='The duration in seconds of every startup phase',
+                                  example={'config': 0.004, 'database': 0.12, 'language_model_load': 14.2})
+})
+
+metrics = api.model('Metrics', {
+    '*': fields.Wildcard(fields.Raw,
+        description='The counters of an application subsystem',
+        example={'batches': 12, 'avg_batch_size': 5.3, 'avg_queue_wait_ms': 2.1})
+})
+
 user_credentials = api.model('User Credentials', {
     'email': fields.String(readOnly=True, required=True, description='The email address of the user', example='johndoe@email.com'),
     'password': fields.String(readOnly=True, required=True, description='The password provided by the user', example='johndoe2020')
@@ -43,7 +61,19 @@ chatbot = api.model('Chatbot', {
     'no_answer_messages': fields.List(
         fields.String, 
         description='The messages used when the chatbot doesn\'t know how to reply', 
-        example=['I\'m sorry, I don\'t understand, please rephrase your question.'])
+        example=['I\'m sorry, I don\'t understand, please rephrase your question.']),
+    'index_type': fields.String(
+        description='The type of question index: exact, ivf (approximate) or auto (ivf for large knowledge bases)',
+        enum=['auto', 'exact', 'ivf'], example='auto'),
+    'index_probes': fields.Integer(
+        description='The number of clusters searched by the ivf index, higher means better recall but slower',
+        example=8),
+    'index_precision': fields.String(
+        description='The storage precision of the question index: float32, float16 or int8 (smaller but less exact)',
+        enum=['float32', 'float16', 'int8'], example='float32'),
+    'index_dimensions': fields.Integer(
+        description='The number of dimensions question embeddings are projected to, empty keeps all dimensions',
+        example=128)
 })
 
 qa = api.model('QA', {
@@ -60,7 +90,33 @@ qa = api.model('QA', {
         example=['You can call me {{botname}}, nice to meet you!'])
 })
 
+qa_conflict = api.model('QA Conflict', {
+    'question': fields.String(readOnly=True, example='What is your name?',
+        description='The imported question that conflicts'),
+    'qa_id': fields.Integer(readOnly=True, example=3,
+        description='The id of the existing QA it conflicts with'),
+    'item': fields.Integer(readOnly=True, example=None,
+        description='The position of the earlier imported QA it conflicts with'),
+    'score': fields.Float(readOnly=True, example=0.995,
+        description='The similarity between the questions')
+})
+
+qa_import_result = api.model('QA Import Result', {
+    'item': fields.Integer(readOnly=True, example=0,
+        description='The position of the QA in the import'),
+    'status': fields.String(readOnly=True, enum=['created', 'conflict', 'invalid'], example='created',
+        description='Whether the QA was created, or skipped because it conflicts or is invalid'),
+    'qa_id': fields.Integer(readOnly=True, example=12,
+        description='The id of the created QA'),
+    'conflicts': fields.List(fields.Nested(qa_conflict), readOnly=True,
+        description='The questions that conflict with existing or earlier imported QAs'),
+    'message': fields.String(readOnly=True, example=None,
+        description='Why the QA is invalid')
+})
+
 message = api.model('Message', {
+    'id': fields.Integer(readOnly=True, example=42,
+        description='The id of the message, used as cursor for the history, empty while it is being stored'),
     'text': fields.String(readOnly=True, example='Hello, how can I help you?',
         description='The message'),
     'is_bot_message': fields.Boolean(readOnly=True, example=True,
@@ -69,6 +125,28 @@ message = api.model('Message', {
         description='The timestamp the message was created')
 })
 
+questions = api.model('Questions', {
+    'questions': fields.List(fields.String, required=True,
+        description='The questions to ask, an empty question returns a welcome message',
+        example=['What is your name?', 'Can I call you?']),
+    'top': fields.Integer(required=False, default=0, min=0,
+        description='The number of best matching QAs to return as alternatives for every question', example=0)
+})
+
+alternative = api.model('Alternative', {
+    'qa_id': fields.Integer(readOnly=True, example=3,
+        description='The id of the matching QA'),
+    'question': fields.String(readOnly=True, example='What is your name?',
+        description='The first question of the matching QA'),
+    'score': fields.Float(readOnly=True, example=0.812,
+        description='The match score between 0 and 1')
+})
+
+answer_message = api.inherit('Answer Message', message, {
+    'alternatives': fields.List(fields.Nested(alternative), readOnly=True,
+        description='The best matching QAs, ordered by score, when requested with the top parameter')
+})
+
 qa_statistics = api.model('QA Statistics', {
     'qa_count': fields.Integer(readOnly=True, example=345,
         description='The total count of QAs'),
@@ -114,5 +192,6 @@ chatbot_statistics_dict = api.model('Chatbot Statistics per day', {
 
 suggestion = api.model('Suggestion', {
     'text': fields.String(readOnly=True, example='How much does TV Plus cost?', description='The text'),
-    'score': fields.Float(readOnly=True, example=0.393, description='The relevance score between 0 and 1.')
+    'score': fields.Float(readOnly=True, example=0.393, description='The relevance score between 0 and 1.'),
+    'count': fields.Integer(readOnly=True, example=12, description='The number of similar unanswered questions.')
 })
\ No newline at end of file
@@ -0,0 +1,112 @@
+import time
+import click
+import numpy as np
+from flask import current_app as app
+from flask.cli import with_appcontext
+from easychatbot.database.models import Chatbot, Message, Question
+from easychatbot.normalization import normalize_multiple
+from easychatbot.encoder_service import load_sentence_transformer
+from easychatbot.daily_stats import backfill_daily_stats
+from easychatbot.language_model import encode, wait_until_ready
+from easychatbot.index import QuestionIndex, IVFIndex, load_question_embeddings, evaluate_index, normalize_vectors
+
+
+@click.command('index-report')
+@click.argument('chatbot_id', type=int)
+@click.option('--queries', default=1000, help='The maximum number of logged user questions to evaluate.')
+@with_appcontext
+def index_report_command(chatbot_id, queries):
+    """Compare the question index modes of a chatbot against exact float32 matching"""
+
+    wait_until_ready()
+    qa_ids, _, embeddings = load_question_embeddings(chatbot_id)
+    if not qa_ids:
+        raise click.ClickException(f'No questions could be encoded for chatbot {chatbot_id}.')
+
+    messages = Message.query\
+        .with_entities(Message.normalized_text)\
+        .filter(Message.chatbot_id == chatbot_id, Message.normalized_text != None)\
+        .order_by(Message.id.desc())\
+        .limit(queries)\
+        .all()
+    query_embeddings = encode([m.normalized_text for m in messages])
+    if len(query_embeddings) == 0:
+        raise click.ClickException(f'No logged user questions found for chatbot {chatbot_id}.')
+
+    chatbot = Chatbot.query.get(chatbot_id)
+    threshold = chatbot.match_threshold if chatbot else None
+    reference = QuestionIndex(chatbot_id, None, qa_ids, embeddings)
+    click.echo(f'{len(qa_ids)} questions, {len(query_embeddings)} queries, match threshold {threshold}')
+    click.echo(f'{"mode":<16}{"dimensions":>12}{"memory kb":>12}{"top1 agreement":>16}{"mean delta":>12}'
+               f'{"max delta":>12}{"score drift":>13}{"threshold flips":>17}{"search ms":>12}')
+    for name, index in get_index_modes(chatbot_id, qa_ids, embeddings):
+        stats = evaluate_index(reference, index, query_embeddings, threshold)
+        click.echo(f'{name:<16}{stats["dimensions"]:>12}{stats["memory_kb"]:>12.1f}{stats["top1_agreement"]:>15.2f}%'
+                   f'{stats["mean_score_delta"]:>12.5f}{stats["max_score_delta"]:>12.5f}'
+                   f'{stats["mean_score_drift"]:>+13.5f}{stats["threshold_flips"]:>16.2f}%{stats["search_ms"]:>12.3f}')
+
+
+def get_index_modes(chatbot_id, qa_ids, embeddings):
+    for precision in ('float32', 'float16', 'int8'):
+        yield precision, QuestionIndex(chatbot_id, None, qa_ids, embeddings, precision)
+    yield 'ivf', IVFIndex(chatbot_id, None, qa_ids, embeddings, 'float32', None, 0.0, None,
+                          app.config['IVF_PROBES'], app.config['IVF_KMEANS_ITERATIONS'])
+    chatbot = Chatbot.query.get(chatbot_id)
+    for dimensions in sorted({64, 128, 256, (chatbot and chatbot.index_dimensions) or 256}):
+        index = QuestionIndex(chatbot_id, None, qa_ids, embeddings, 'float32', None, 0.0, dimensions)
+        if index.projection:
+            yield f'pca-{dimensions}', index
+
+
+@click.command('encoder-benchmark')
+@click.option('--chatbot-id', type=int, help='Only benchmark the questions of this chatbot.')
+@click.option('--limit', default=2000, help='The maximum number of stored questions to encode.')
+@click.option('--batch-size', default=32, help='The number of texts encoded per call.')
+@with_appcontext
+def encoder_benchmark_command(chatbot_id, limit, batch_size):
+    """Compare the latency and the embeddings of the quantized encoder against the float encoder"""
+
+    query = Question.query.with_entities(Question.text)
+    if chatbot_id is not None:
+        query = query.filter_by(chatbot_id=chatbot_id)
+    texts = list(dict.fromkeys(normalize_multiple([q.text for q in query.order_by(Question.id).limit(limit).all()])))
+    if not texts:
+        raise click.ClickException('No stored questions found.')
+
+    results = {}
+    for name, quantize in (('float32', False), ('int8', True)):
+        sentence_transformer = load_sentence_transformer(app.config, app.logger, quantize)
+        sentence_transformer.encode(texts[:batch_size])
+        started = time.perf_counter()
+        embeddings = [e for start in range(0, len(texts), batch_size)
+                      for e in sentence_transformer.encode(texts[start:start + batch_size])]
+        results[name] = time.perf_counter() - started, normalize_vectors(embeddings)
+
+    float_elapsed, float_embeddings = results['float32']
+    int8_elapsed, int8_embeddings = results['int8']
+    similarities = np.sum(float_embeddings * int8_embeddings, axis=1)
+    agreement = np.argmax(int8_embeddings @ float_embeddings.T, axis=1) == np.arange(len(texts))
+
+    click.echo(f'{len(texts)} questions, batches of {batch_size}')
+    click.echo(f'{"mode":<10}{"ms per text":>14}')
+    click.echo(f'{"float32":<10}{1000 * float_elapsed / len(texts):>14.3f}')
+    click.echo(f'{"int8":<10}{1000 * int8_elapsed / len(texts):>14.3f}')
+    click.echo(f'speedup: {float_elapsed / int8_elapsed:.2f}x')
+    click.echo(f'cosine similarity to float32: mean {similarities.mean():.5f}, min {similarities.min():.5f}')
+    click.echo(f'nearest float32 question is itself: {100.0 * agreement.mean():.2f}%')
+
+
+@click.command('backfill-statistics')
+@click.option('--chatbot-id', type=int, help='Only rebuild the statistics of this chatbot.')
+@with_appcontext
+def backfill_statistics_command(chatbot_id):
+    """Rebuild the daily message statistics from the stored messages"""
+
+    count = backfill_daily_stats(chatbot_id)
+    click.echo(f'Rebuilt the daily statistics of {count} messages')
+
+
+def register_commands(app):
+    app.cli.add_command(index_report_command)
+    app.cli.add_command(encoder_benchmark_command)
+    app.cli.add_command(backfill_statistics_command)
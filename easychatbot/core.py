@@ -1,18 +1,202 @@
 import re
+import sys
+import queue
+import threading
+import time
 from collections import OrderedDict
 
 
-class LimitedSizeDict(OrderedDict):
-    def __init__(self, *args, **kwds):
-        self.size_limit = kwds.pop("size_limit", None)
-        OrderedDict.__init__(self, *args, **kwds)
-        self._check_size_limit()
+class LRUCache:
+    def __init__(self, max_bytes, stripes=16):
+        self.max_bytes = max_bytes
+        self.stripes = [LRUCacheStripe(max_bytes / stripes) for _ in range(stripes)]
+
+    def __len__(self):
+        return sum(len(stripe.items) for stripe in self.stripes)
+
+    def __contains__(self, key):
+        return self.__stripe(key).contains(key)
+
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
 
     def __setitem__(self, key, value):
-        OrderedDict.__setitem__(self, key, value)
-        self._check_size_limit()
+        self.__stripe(key).set(key, value)
+
+    def get(self, key, default=None):
+        return self.__stripe(key).get(key, default)
+
+    def update(self, items):
+        for key, value in items.items() if hasattr(items, 'items') else items:
+            self[key] = value
+
+    def items(self):
+        return [item for stripe in self.stripes for item in stripe.snapshot()]
+
+    def stats(self):
+        stats = {'entries': 0, 'bytes': 0, 'max_bytes': self.max_bytes, 'hits': 0, 'misses': 0, 'evictions': 0}
+        for stripe in self.stripes:
+            with stripe.lock:
+                stats['entries'] += len(stripe.items)
+                stats['bytes'] += stripe.bytes
+                for counter in ('hits', 'misses', 'evictions'):
+                    stats[counter] += getattr(stripe, counter)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def __stripe(self, key):
+        return self.stripes[hash(key) % len(self.stripes)]
+
+
+class LRUCacheStripe:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def contains(self, key):
+        with self.lock:
+            return key in self.items
+
+    def get(self, key, default):
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key][0]
+
+    def set(self, key, value):
+        size = sizeof(key) + sizeof(value)
+        with self.lock:
+            if key in self.items:
+                self.bytes -= self.items.pop(key)[1]
+            self.items[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self.items:
+                _, (_, evicted_size) = self.items.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def snapshot(self):
+        with self.lock:
+            return [(key, value) for key, (value, _) in self.items.items()]
+
+
+def sizeof(value):
+    if hasattr(value, 'nbytes'):
+        return sys.getsizeof(value) + (value.nbytes if getattr(value, 'base', None) is not None else 0)
+    return sys.getsizeof(value)
+
+
+class EncodeRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.embeddings = []
+        self.error = None
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.done = threading.Event()
+
+    @property
+    def remaining(self):
+        return len(self.texts) - len(self.embeddings)
+
+
+# Texts of concurrent requests are encoded together in batches of up to max_batch_size texts. A small request waits up
+# to max_wait for others to join its batch. Larger requests are encoded in chunks, and every batch is filled with the
+# requests closest to completion first, so chat requests are not stuck behind the encoding of a whole knowledge base.
+class EncodeBatcher:
+    def __init__(self, encode_fn, max_batch_size, max_wait, logger):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.logger = logger
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'batches': 0, 'texts': 0, 'max_batch_size': 0, 'chunked_requests': 0,
+                         'queue_wait_ms': 0.0, 'max_queue_wait_ms': 0.0}
+        self.thread = threading.Thread(target=self.__run, name='encode-batcher', daemon=True)
+        self.thread.start()
+
+    def encode(self, texts):
+        request = EncodeRequest(texts)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.embeddings
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['avg_batch_size'] = stats['texts'] / stats['batches'] if stats['batches'] else 0
+        stats['avg_queue_wait_ms'] = stats['queue_wait_ms'] / stats['requests'] if stats['requests'] else 0
+        return stats
+
+    def __run(self):
+        active = []
+        while True:
+            if not active:
+                active.append(self.queue.get())
+                deadline = time.monotonic() + self.max_wait
+            else:
+                # requests that are partly encoded do not wait, only the requests queued meanwhile join them
+                deadline = 0
+            while True:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0 and sum(request.remaining for request in active) < self.max_batch_size:
+                        active.append(self.queue.get(timeout=timeout))
+                    else:
+                        active.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            active = self.__process(active)
+
+    def __process(self, requests):
+        started = time.monotonic()
+        chunks, size = [], 0
+        for request in sorted(requests, key=lambda request: request.remaining):
+            count = min(request.remaining, self.max_batch_size - size)
+            if count == 0 and request.remaining:
+                break
+            offset = len(request.embeddings)
+            request.started = request.started or started
+            chunks.append((request, request.texts[offset:offset + count]))
+            size += count
+
+        texts = list(set(text for _, chunk in chunks for text in chunk))
+        try:
+            embeddings = dict(zip(texts, self.encode_fn(texts))) if texts else {}
+            for request, chunk in chunks:
+                request.embeddings += [embeddings[text] for text in chunk]
+        except Exception as e:
+            self.logger.exception('Unable to encode batch')
+            for request, _ in chunks:
+                request.error = e
+
+        finished = [request for request, _ in chunks if request.error or request.remaining == 0]
+        waits = [(request.started - request.enqueued) * 1000 for request in finished]
+        with self.lock:
+            self.counters['requests'] += len(finished)
+            self.counters['batches'] += 1
+            self.counters['texts'] += len(texts)
+            self.counters['max_batch_size'] = max(self.counters['max_batch_size'], len(texts))
+            self.counters['chunked_requests'] += \
+                sum(1 for request in finished if len(request.texts) > self.max_batch_size)
+            self.counters['queue_wait_ms'] += sum(waits)
+            self.counters['max_queue_wait_ms'] = max([self.counters['max_queue_wait_ms']] + waits)
 
-    def _check_size_limit(self):
-        if self.size_limit is not None:
-            while len(self) > self.size_limit:
-                self.popitem(last=False)
+        for request in finished:
+            request.done.set()
+        return [request for request in requests if not request.done.is_set()]
@@ -0,0 +1,97 @@
+from easychatbot.database import db
+from easychatbot.database.models import Message, MessageDailyStats
+from easychatbot.sketches import HyperLogLog
+
+
+def update_daily_stats(messages):
+    deltas = {}
+    for m in messages:
+        key = (m['chatbot_id'], m['created'].date())
+        delta = deltas.get(key)
+        if delta is None:
+            delta = deltas[key] = {'message_count': 0, 'bot_message_count': 0, 'no_answer_count': 0,
+                                   'score_sum': 0.0, 'users': HyperLogLog(), 'sessions': HyperLogLog()}
+        delta['message_count'] += 1
+        if m['score'] is not None:
+            delta['bot_message_count'] += 1
+            delta['score_sum'] += m['score']
+        if m['is_no_answer']:
+            delta['no_answer_count'] += 1
+        delta['users'].add(m['user_id'])
+        delta['sessions'].add(m['session_id'])
+    if not deltas:
+        return
+
+    existing = MessageDailyStats.query\
+        .filter(MessageDailyStats.chatbot_id.in_(set(chatbot_id for chatbot_id, _ in deltas)))\
+        .filter(MessageDailyStats.day.in_(set(day for _, day in deltas)))\
+        .all()
+    existing = {(s.chatbot_id, s.day): s for s in existing}
+
+    for (chatbot_id, day), delta in deltas.items():
+        stats = existing.get((chatbot_id, day))
+        if stats is None:
+            stats = MessageDailyStats(chatbot_id=chatbot_id, day=day, message_count=0, bot_message_count=0,
+                                      no_answer_count=0, score_sum=0.0)
+            db.session.add(stats)
+        stats.message_count += delta['message_count']
+        stats.bot_message_count += delta['bot_message_count']
+        stats.no_answer_count += delta['no_answer_count']
+        stats.score_sum += delta['score_sum']
+        stats.user_sketch = HyperLogLog.from_bytes(stats.user_sketch).merge(delta['users']).to_bytes()
+        stats.session_sketch = HyperLogLog.from_bytes(stats.session_sketch).merge(delta['sessions']).to_bytes()
+
+
+def backfill_daily_stats(chatbot_id=None, batch_size=10000):
+    query = MessageDailyStats.query
+    if chatbot_id is not None:
+        query = query.filter_by(chatbot_id=chatbot_id)
+    query.delete(synchronize_session=False)
+
+    columns = [Message.id, Message.chatbot_id, Message.user_id, Message.session_id, Message.score,
+               Message.is_no_answer, Message.created]
+    last_id, count = 0, 0
+    while True:
+        query = Message.query.with_entities(*columns).filter(Message.id > last_id)
+        if chatbot_id is not None:
+            query = query.filter_by(chatbot_id=chatbot_id)
+        messages = query.order_by(Message.id).limit(batch_size).all()
+        if not messages:
+            break
+        update_daily_stats([m._asdict() for m in messages if m.created is not None])
+        db.session.flush()
+        last_id, count = messages[-1].id, count + len(messages)
+
+    db.session.commit()
+    return count
+
+
+def get_daily_stats(chatbot_id, date_from=None, date_to=None):
+    query = MessageDailyStats.query.filter_by(chatbot_id=chatbot_id)
+    if date_from is not None:
+        query = query.filter(MessageDailyStats.day >= date_from)
+    if date_to is not None:
+        query = query.filter(MessageDailyStats.day <= date_to)
+    return query.order_by(MessageDailyStats.day).all()
+
+
+def summarize_daily_stats(daily_stats):
+    message_count = sum(s.message_count for s in daily_stats)
+    bot_message_count = sum(s.bot_message_count for s in daily_stats)
+    no_answer_count = sum(s.no_answer_count for s in daily_stats)
+    score_sum = sum(s.score_sum for s in daily_stats)
+    users, sessions = HyperLogLog(), HyperLogLog()
+    for s in daily_stats:
+        users.merge(HyperLogLog.from_bytes(s.user_sketch))
+        sessions.merge(HyperLogLog.from_bytes(s.session_sketch))
+
+    return {
+        'user_count': users.count(),
+        'session_count': sessions.count(),
+        'total_msg_count': message_count,
+        'bot_msg_count': bot_message_count,
+        'user_msg_count': message_count - bot_message_count,
+        'accuracy': 100.0 - no_answer_count / bot_message_count * 100 if bot_message_count else 0,
+        'match_score': score_sum / bot_message_count if bot_message_count else 0
+    }
+
@@ -1,4 +1,22 @@
+import math
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+
+
+@event.listens_for(Engine, 'connect')
+def register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('log2', 1, lambda x: math.log2(x) if x and x > 0 else None)
+
+
+def insert_many(table, values):
+    db.session.execute(table.insert(), values)
+    # the insert holds the sqlite write lock until the commit, so no other writer can add rows between the batch and
+    # this read, and sqlite assigns the rowids of the batch consecutively
+    last_id = db.session.query(db.func.max(table.c.id)).scalar()
+    return list(range(last_id - len(values) + 1, last_id + 1))
@@ -41,6 +41,11 @@ class Chatbot(db.Model):
     match_threshold = db.Column(db.Float(), default=0.7)
     welcome_messages = db.Column(db.Text, default='[]')
     no_answer_messages = db.Column(db.Text, default='[]')
+    kb_version = db.Column(db.Integer, default=0)
+    index_type = db.Column(db.String(16), default='auto')
+    index_probes = db.Column(db.Integer, default=None)
+    index_precision = db.Column(db.String(16), default='float32')
+    index_dimensions = db.Column(db.Integer, default=None)
     
     def __repr__(self):
         return '<Chatbot: {}>'.format(self.name)
@@ -84,6 +89,7 @@ class Answer(db.Model):
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (db.Index('ix_messages_session_id_id', 'session_id', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(36), index=True)
@@ -100,6 +106,24 @@ class Message(db.Model):
         return '<Message: {}>'.format(self.text)
 
 
+class MessageDailyStats(db.Model):
+    __tablename__ = 'message_daily_stats'
+    __table_args__ = (db.UniqueConstraint('chatbot_id', 'day'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    chatbot_id = db.Column(db.Integer, db.ForeignKey('chatbots.id'), index=True)
+    day = db.Column(db.Date, index=True)
+    message_count = db.Column(db.Integer, default=0)
+    bot_message_count = db.Column(db.Integer, default=0)
+    no_answer_count = db.Column(db.Integer, default=0)
+    score_sum = db.Column(db.Float, default=0.0)
+    user_sketch = db.Column(db.LargeBinary, default=None)
+    session_sketch = db.Column(db.LargeBinary, default=None)
+
+    def __repr__(self):
+        return '<MessageDailyStats: {} {}>'.format(self.chatbot_id, self.day)
+
+
 class Suggestion(db.Model):
     __tablename__ = 'suggestions'
 
@@ -109,6 +133,7 @@ class Suggestion(db.Model):
     normalized_text = db.Column(db.String(1024), index=True)
     count = db.Column(db.Integer)
     score = db.Column(db.Float)
+    centroid = db.Column(db.LargeBinary, default=None)
     
     def __repr__(self):
         return '<Suggestion: {}>'.format(self.text)
\ No newline at end of file
@@ -0,0 +1,162 @@
+import os
+import json
+import socket
+import socketserver
+import struct
+import threading
+import numpy as np
+from .core import EncodeBatcher
+
+
+# A request is a length prefixed utf-8 json list of texts. A response is a (rows, dimensions) header
+# followed by the float32 embeddings, or a negative row count followed by a length prefixed error message.
+LENGTH = struct.Struct('>I')
+HEADER = struct.Struct('>iI')
+
+
+class EncoderClient:
+    def __init__(self, path, timeout, batch_size):
+        self.path = path
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'texts': 0, 'reconnects': 0}
+
+    def encode(self, texts):
+        # large requests are sent in batches, so every round trip stays within the timeout and the requests of other
+        # workers are encoded in between
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings += list(self.__encode(texts[start:start + self.batch_size]))
+        return embeddings
+
+    def __encode(self, texts):
+        try:
+            embeddings = self.__request(texts)
+        except (ConnectionError, socket.timeout):
+            self.__close()
+            with self.lock:
+                self.counters['reconnects'] += 1
+            embeddings = self.__request(texts)
+
+        with self.lock:
+            self.counters['requests'] += 1
+            self.counters['texts'] += len(texts)
+        return embeddings
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['socket'] = self.path
+        return stats
+
+    def __request(self, texts):
+        connection = self.__connection()
+        send_frame(connection, json.dumps(texts).encode('utf-8'))
+        rows, dimensions = HEADER.unpack(receive(connection, HEADER.size))
+        if rows < 0:
+            raise RuntimeError('Encoder service error: ' + receive_frame(connection).decode('utf-8'))
+        data = receive(connection, rows * dimensions * 4)
+        return np.frombuffer(data, dtype=np.float32).reshape(rows, dimensions)
+
+    def __connection(self):
+        if getattr(self.local, 'connection', None) is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            connection.connect(self.path)
+            self.local.connection = connection
+        return self.local.connection
+
+    def __close(self):
+        connection = getattr(self.local, 'connection', None)
+        self.local.connection = None
+        if connection is not None:
+            connection.close()
+
+
+class EncoderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, encoder, logger):
+        self.encoder = encoder
+        self.logger = logger
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, EncoderRequestHandler)
+
+
+class EncoderRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                frame = receive_frame(self.request)
+            except ConnectionError:
+                return
+
+            try:
+                texts = json.loads(frame.decode('utf-8'))
+            except ValueError as e:
+                self.send_error(f'Invalid request: {e}')
+                continue
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                self.send_error('Invalid request: expected a list of texts')
+                continue
+
+            try:
+                embeddings = np.array(self.server.encoder.encode(texts), dtype=np.float32, ndmin=2)
+            except Exception as e:
+                self.server.logger.exception('Unable to encode texts')
+                self.send_error(str(e))
+                continue
+
+            rows, dimensions = embeddings.shape if len(texts) else (0, 0)
+            self.request.sendall(HEADER.pack(rows, dimensions) + embeddings.tobytes())
+
+    def send_error(self, message):
+        self.request.sendall(HEADER.pack(-1, 0))
+        send_frame(self.request, message.encode('utf-8'))
+
+
+def serve(config, logger):
+    sentence_transformer = load_sentence_transformer(config, logger)
+    encoder = EncodeBatcher(sentence_transformer.encode, config['ENCODE_BATCH_SIZE'],
+                            config['ENCODE_BATCH_WAIT_MS'] / 1000, logger)
+
+    with EncoderServer(config['ENCODER_SOCKET'], encoder, logger) as server:
+        logger.info(f'Encoder service listening on {config["ENCODER_SOCKET"]}')
+        server.serve_forever()
+
+
+def load_sentence_transformer(config, logger, quantize=None):
+    from sentence_transformers import SentenceTransformer
+
+    quantize = config['LANGUAGE_MODEL_QUANTIZE'] if quantize is None else quantize
+    if not quantize:
+        return SentenceTransformer(config['LANGUAGE_MODEL_NAME'])
+
+    import torch
+    # the float weights have to be loaded anyway, so the int8 model is quantized from them at every start. Only the
+    # linear layers are quantized, their weights are stored as int8 and activations are quantized on the fly.
+    return torch.quantization.quantize_dynamic(
+        SentenceTransformer(config['LANGUAGE_MODEL_NAME'], device='cpu'), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def send_frame(connection, data):
+    connection.sendall(LENGTH.pack(len(data)) + data)
+
+
+def receive_frame(connection):
+    length, = LENGTH.unpack(receive(connection, LENGTH.size))
+    return receive(connection, length)
+
+
+def receive(connection, size):
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('Connection closed by the encoder service')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
@@ -1,16 +1,16 @@
 import os.path
+import itertools
 import random
 import json
 import uuid
-import scipy.spatial
-import numpy as np
 from datetime import datetime
 from flask import current_app as app
 from flask import session, g
 from easychatbot.database import db
 from easychatbot.database.models import Chatbot, QA, Question, Answer, Message
-from easychatbot.normalization import normalize_single, normalize_multiple
+from easychatbot.normalization import normalize_single
 from easychatbot.language_model import encode
+from easychatbot.index import get_index, count_matches
 from easychatbot.tags import replace_tags
 
 
@@ -21,37 +21,61 @@ class Engine:
         self.match_threshold = g.chatbot.match_threshold
         self.welcome_messages = json.loads(g.chatbot.welcome_messages)
         self.no_answer_messages = json.loads(g.chatbot.no_answer_messages)
-        self.qas = g.qas = g.qas if 'qas' in g else QA.query.filter_by(chatbot_id=chatbot_id).join(Question).join(Answer).all()
 
     def get_qa(self, query):
-        if len(self.qas) == 0:
-            return None, 0
+        results = self.get_qas(query, 1)
+        return results[0] if results else (None, 0)
 
-        qas = [qa for qa in self.qas for q in qa.questions]
-        questions = [q.text for qa in self.qas for q in qa.questions]
-        normalized_questions = normalize_multiple(questions)
-        question_embeddings = encode(normalized_questions)
+    def get_qas(self, query, top):
+        return self.get_qas_multiple([normalize_single(query)], top)[0]
 
-        normalized_query = normalize_single(query)
-        query_embeddings = encode([normalized_query])
+    def get_qas_multiple(self, normalized_queries, top):
+        index = get_index(g.chatbot)
+        if not index or len(normalized_queries) == 0:
+            return [[] for _ in normalized_queries]
 
-        distances = scipy.spatial.distance.cdist(query_embeddings, question_embeddings, "cosine")[0]
-        results = zip(range(len(distances)), distances)
-        results = sorted(results, key=lambda x: x[1])
+        # questions that normalize to a stored question are answered without encoding them
+        exact_matches = [index.match_exact(query) for query in normalized_queries]
+        results = [[(qa_id, 1.0)] if qa_id is not None and top == 1 else None for qa_id in exact_matches]
+        pending = [idx for idx, result in enumerate(results) if result is None]
+        count_matches('exact_matches', len(results) - len(pending))
+        count_matches('semantic_matches', len(pending))
 
-        idx, distance = results[0]
-        score = max(0, float(1.0 - distance))
+        if pending:
+            pending_queries = [normalized_queries[idx] for idx in pending]
+            query_embeddings = encode(pending_queries)
+            found = index.search_multiple(query_embeddings, top, pending_queries) if len(query_embeddings) else []
+            for idx, result in itertools.zip_longest(pending, found, fillvalue=[]):
+                if exact_matches[idx] is not None:
+                    result = [(exact_matches[idx], 1.0)] + [r for r in result if r[0] != exact_matches[idx]][:top - 1]
+                results[idx] = result
 
-        return qas[idx], score
+        qa_ids = set(qa_id for result in results for qa_id, _ in result)
+        qas = QA.query.filter(QA.id.in_(qa_ids)).all()
+        qas = {qa.id: qa for qa in qas}
 
-    def get_answer(self, question):
-        if not question:
-            return replace_tags(self.__get_welcome_message()), 1.0, True, False
-        qa, score = self.get_qa(question)
-        answer = qa.answers[0].text
-        if score < self.match_threshold:
-            return replace_tags(self.__get_no_answer_message()), score, False, True
-        return replace_tags(answer), score, False, False
+        return [[(qas[qa_id], max(0, score)) for qa_id, score in result if qa_id in qas] for result in results]
+
+    def get_answer(self, question, top=1, normalized_question=None):
+        normalized_question = normalized_question or (normalize_single(question) if question else None)
+        return self.get_answers([question], [normalized_question], top)[0]
+
+    def get_answers(self, questions, normalized_questions, top=1):
+        asked = [idx for idx, question in enumerate(questions) if question]
+        results = self.get_qas_multiple([normalized_questions[idx] for idx in asked], max(1, top))
+        results = dict(zip(asked, results))
+
+        answers = []
+        for idx, question in enumerate(questions):
+            if not question:
+                answers.append((replace_tags(self.__get_welcome_message()), 1.0, True, False, []))
+                continue
+            qa, score = results[idx][0] if results[idx] else (None, 0)
+            if not qa or not qa.answers or score < self.match_threshold:
+                answers.append((replace_tags(self.__get_no_answer_message()), score, False, True, results[idx]))
+            else:
+                answers.append((replace_tags(qa.answers[0].text), score, False, False, results[idx]))
+        return answers
 
     def __get_welcome_message(self):
         if not self.welcome_messages:
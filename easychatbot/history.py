@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from flask import current_app as app
+
+
+history_buffer = None
+
+
+def init_history():
+    global history_buffer
+    history_buffer = HistoryBuffer(app.config['HISTORY_BUFFER_SIZE'], app.config['HISTORY_BUFFER_SESSIONS'],
+                                   app.config['HISTORY_BUFFER_TTL_SECONDS'], app.config['HISTORY_BUFFER_CHECK_SECONDS'])
+
+
+def record_message(row):
+    if history_buffer:
+        history_buffer.append(row)
+
+
+class SessionHistory:
+    def __init__(self, messages, size, complete):
+        self.messages = deque(messages, maxlen=size)
+        self.complete = complete
+        self.last_id = max((m['id'] for m in messages if m['id'] is not None), default=0)
+        self.seeded = self.checked = time.monotonic()
+
+
+# Keeps the latest messages of recently active sessions. A session is seeded from the database and then fed with
+# the messages journaled by this process, until it expires after ttl seconds. complete means the buffer still holds
+# every message of the session. Other processes may store messages of the same session, so at most every
+# check_interval seconds the ids stored since the last check are compared with the buffered ones. A message stored by
+# another process can be missing for up to check_interval seconds, a check_interval of None never checks and is only
+# correct when every session is served by a single process.
+class HistoryBuffer:
+    def __init__(self, size, max_sessions, ttl, check_interval=None):
+        self.size = size
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        self.counters = {'hits': 0, 'misses': 0, 'checks': 0, 'stale': 0}
+
+    def seed(self, session_id, messages, pending):
+        with self.lock:
+            # a message journaled after the pending messages were read was not buffered, the session was not seeded
+            stored = set((m['created'], m['text']) for m in messages)
+            messages = messages + [m for m in pending() if (m['created'], m['text']) not in stored]
+            self.sessions[session_id] = SessionHistory(messages[-self.size:], self.size, len(messages) < self.size)
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+    def append(self, row):
+        with self.lock:
+            history = self.sessions.get(row['session_id'])
+            if history is not None and not any(m is row for m in reversed(history.messages)):
+                if len(history.messages) == self.size:
+                    history.complete = False
+                history.messages.append(row)
+
+    def latest(self, session_id, limit, after=None, load_ids=None):
+        now = time.monotonic()
+        with self.lock:
+            history = self.sessions.get(session_id)
+            if history is not None and now - history.seeded > self.ttl:
+                del self.sessions[session_id]
+                history = None
+            messages = list(history.messages) if history is not None else []
+            complete = history is not None and history.complete
+            last_id, checked = (history.last_id, history.checked) if history is not None else (0, now)
+
+        if after is None:
+            found = complete or len(messages) >= limit
+        else:
+            first_id = messages[0]['id'] if messages else None
+            found = complete or (first_id is not None and first_id <= after)
+
+        stale, stored_ids = False, None
+        if found and load_ids is not None and self.check_interval is not None and now - checked >= self.check_interval:
+            stored_ids = load_ids(last_id)
+            stale = not set(m['id'] for m in messages).issuperset(stored_ids)
+        with self.lock:
+            self.counters['checks'] += stored_ids is not None
+            if stale:
+                self.counters['stale'] += 1
+                if self.sessions.get(session_id) is history:
+                    del self.sessions[session_id]
+            elif found and session_id in self.sessions:
+                self.sessions.move_to_end(session_id)
+                if stored_ids is not None:
+                    # rows committed later get higher ids, so the next check only reads the ids after these
+                    history.last_id = max([history.last_id] + stored_ids)
+                    history.checked = now
+            self.counters['hits' if found and not stale else 'misses'] += 1
+
+        if not found or stale:
+            return None
+        if after is None:
+            return messages[-limit:]
+        return [m for m in messages if m['id'] is None or m['id'] > after][:limit]
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['sessions'] = len(self.sessions)
+        return stats
@@ -0,0 +1,113 @@
+import numpy as np
+from flask import current_app as app
+from flask import abort
+from easychatbot.database import db, insert_many
+from easychatbot.database.models import Chatbot, QA, Question, Answer
+from easychatbot.normalization import normalize_multiple
+from easychatbot.language_model import encode, wait_until_ready
+from easychatbot.index import get_index, invalidate_index, match_questions, normalize_vectors
+
+
+def find_conflicts(chatbot_id, questions, exclude_qa_id=None):
+    # qas stay editable while the language model loads, they are then saved without the conflict check
+    if not wait_until_ready(0):
+        app.logger.warning(f'Skipped the conflict check of chatbot {chatbot_id}, the language model is still loading')
+        return []
+    index = get_index(Chatbot.query.filter_by(id=chatbot_id).one())
+    if index is None or len(index) == 0 or not questions:
+        return []
+    normalized_questions = normalize_multiple(questions)
+    embeddings = encode(normalized_questions)
+    if len(embeddings) != len(questions):
+        abort(503, 'The language model is not available to encode the questions.')
+    results = match_questions(index, normalized_questions, embeddings, 2, app.config['QA_IMPORT_BLOCK_SIZE'])
+
+    conflicts = []
+    for question, result in zip(questions, results):
+        for qa_id, score in result:
+            if qa_id != exclude_qa_id and score > app.config['QA_CONFLICT_THRESHOLD']:
+                conflicts.append({'question': question, 'qa_id': qa_id, 'item': None, 'score': score})
+                break
+    return conflicts
+
+
+def import_qas(chatbot_id, items):
+    threshold = app.config['QA_CONFLICT_THRESHOLD']
+    block_size = app.config['QA_IMPORT_BLOCK_SIZE']
+    report = [{'item': idx, 'status': 'created', 'qa_id': None, 'conflicts': [], 'message': None}
+              for idx in range(len(items))]
+
+    questions, owners = [], []
+    for idx, item in enumerate(items):
+        if not is_text_list(item.get('questions')) or not is_text_list(item.get('answers')):
+            report[idx].update(status='invalid',
+                               message='A QA needs a list of questions and a list of answers of non-empty texts.')
+            continue
+        questions += item['questions']
+        owners += [idx] * len(item['questions'])
+    if not questions:
+        return report
+
+    normalized_questions = normalize_multiple(questions)
+    embeddings = encode(normalized_questions)
+    if len(embeddings) != len(questions):
+        abort(503, 'The language model is not available to encode the questions.')
+
+    index = get_index(Chatbot.query.filter_by(id=chatbot_id).one())
+    results = match_questions(index, normalized_questions, embeddings, 1, block_size)
+    for question, owner, result in zip(questions, owners, results):
+        if result and result[0][1] > threshold:
+            report[owner]['conflicts'].append({'question': question, 'qa_id': result[0][0], 'item': None,
+                                               'score': result[0][1]})
+
+    # questions are compared with the earlier questions of the batch one block of rows at a time
+    owners = np.asarray(owners)
+    vectors = index.prepare(embeddings) if index is not None else normalize_vectors(embeddings)
+    candidates = []
+    for start in range(0, len(vectors), block_size):
+        scores = vectors[start:start + block_size] @ vectors[:start + block_size].T
+        for row, row_scores in enumerate(scores, start):
+            earlier = np.flatnonzero(row_scores[:row] > threshold)
+            candidates.append([(k, float(row_scores[k])) for k in earlier if owners[k] != owners[row]])
+
+    # an item only conflicts with earlier items of the batch that are imported themselves
+    for row, row_candidates in enumerate(candidates):
+        for k, score in row_candidates:
+            if report[owners[k]]['status'] == 'created':
+                report[owners[row]]['conflicts'].append({'question': questions[row], 'qa_id': None,
+                                                         'item': int(owners[k]), 'score': score})
+                break
+        if row + 1 == len(candidates) or owners[row + 1] != owners[row]:
+            if report[owners[row]]['conflicts']:
+                report[owners[row]]['status'] = 'conflict'
+
+    created = [idx for idx, result in enumerate(report) if result['status'] == 'created']
+    if created:
+        qa_ids = insert_qas(chatbot_id, [items[idx] for idx in created])
+        for idx, qa_id in zip(created, qa_ids):
+            report[idx]['qa_id'] = qa_id
+        invalidate_index(chatbot_id)
+    db.session.commit()
+
+    return report
+
+
+def is_text_list(value):
+    return isinstance(value, list) and len(value) > 0 and all(isinstance(text, str) and text.strip() for text in value)
+
+
+def insert_qas(chatbot_id, items):
+    qa_ids = insert_many(QA.__table__, [{'chatbot_id': chatbot_id} for _ in items])
+    inserted = QA.query.filter(QA.id.between(qa_ids[0], qa_ids[-1]), QA.chatbot_id == chatbot_id).count() \
+        if qa_ids else 0
+    if inserted != len(items):
+        db.session.rollback()
+        raise RuntimeError(f'Inserted {inserted} qas for {len(items)} items of chatbot {chatbot_id}')
+
+    questions = [{'chatbot_id': chatbot_id, 'qa_id': qa_id, 'text': text}
+                 for qa_id, item in zip(qa_ids, items) for text in item['questions']]
+    answers = [{'chatbot_id': chatbot_id, 'qa_id': qa_id, 'text': text}
+               for qa_id, item in zip(qa_ids, items) for text in item['answers']]
+    db.session.execute(Question.__table__.insert(), questions)
+    db.session.execute(Answer.__table__.insert(), answers)
+    return qa_ids
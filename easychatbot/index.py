@@ -0,0 +1,318 @@
+import threading
+import time
+import numpy as np
+from flask import current_app as app
+from easychatbot.database import db
+from easychatbot.database.models import Chatbot, Question, Answer
+from easychatbot.normalization import normalize_multiple
+from easychatbot.language_model import encode
+from easychatbot.lexical import LexicalIndex
+
+
+class QuestionIndex:
+    def __init__(self, chatbot_id, version, qa_ids, embeddings, precision='float32', texts=None, lexical_weight=0.0,
+                 dimensions=None):
+        self.chatbot_id = chatbot_id
+        self.version = version
+        self.precision = precision
+        self.qa_ids = np.asarray(qa_ids, dtype=np.int64)
+        self.projection = Projection.fit(embeddings, dimensions) if dimensions and len(self.qa_ids) else None
+        embeddings = self.prepare(embeddings) if len(self.qa_ids) else np.zeros((0, 0), dtype=np.float32)
+        self.vectors, self.scales = quantize(embeddings, precision)
+        # questions are grouped per qa, so the best question of every qa can be reduced in one pass
+        self.qa_offsets = np.flatnonzero(np.r_[True, self.qa_ids[1:] != self.qa_ids[:-1]]) if len(self.qa_ids) else self.qa_ids
+        self.unique_qa_ids = self.qa_ids[self.qa_offsets]
+
+        self.exact_matches = {}
+        for qa_id, text in zip(self.qa_ids, texts or []):
+            if text:
+                self.exact_matches.setdefault(text, int(qa_id))
+        self.lexical = LexicalIndex(texts) if texts is not None and lexical_weight > 0 else None
+        self.lexical_weight = lexical_weight if self.lexical else 0.0
+
+    def __len__(self):
+        return len(self.qa_ids)
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0) + \
+            (self.projection.nbytes if self.projection else 0)
+
+    def prepare(self, embeddings):
+        return normalize_vectors(self.projection.apply(embeddings) if self.projection else embeddings)
+
+    def scores(self, query_embeddings, rows=None):
+        return self.prepared_scores(self.prepare(query_embeddings), rows)
+
+    def prepared_scores(self, queries, rows=None):
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        scales = self.scales if rows is None or self.scales is None else self.scales[rows]
+        return dot(queries, vectors, scales)
+
+    def hybrid_scores(self, scores, normalized_queries, rows=None):
+        lexical_scores = np.array([self.lexical.scores(query) for query in normalized_queries], ndmin=2)
+        lexical_scores /= np.maximum(lexical_scores.max(axis=1, keepdims=True), 1e-6)
+        if rows is not None:
+            lexical_scores = lexical_scores[:, rows]
+        return (1 - self.lexical_weight) * scores + self.lexical_weight * lexical_scores
+
+    def match_exact(self, normalized_query):
+        return self.exact_matches.get(normalized_query) if normalized_query else None
+
+    def search(self, query_embedding, top=1, normalized_query=None):
+        normalized_queries = [normalized_query] if normalized_query is not None else None
+        return self.search_multiple([query_embedding], top, normalized_queries)[0]
+
+    def search_multiple(self, query_embeddings, top=1, normalized_queries=None):
+        scores = self.scores(query_embeddings)
+        if self.lexical_weight and normalized_queries is not None:
+            scores = self.hybrid_scores(scores, normalized_queries)
+        qa_scores = np.maximum.reduceat(scores, self.qa_offsets, axis=1)
+        return [[(int(self.unique_qa_ids[idx]), float(row[idx])) for idx in top_k(row, top)] for row in qa_scores]
+
+
+class IVFIndex(QuestionIndex):
+    def __init__(self, chatbot_id, version, qa_ids, embeddings, precision='float32', texts=None, lexical_weight=0.0,
+                 dimensions=None, probes=8, iterations=10):
+        super().__init__(chatbot_id, version, qa_ids, embeddings, precision, texts, lexical_weight, dimensions)
+        self.probes = probes
+        self.row_qa_positions = np.cumsum(np.r_[False, self.qa_ids[1:] != self.qa_ids[:-1]])
+        embeddings = self.prepare(embeddings)
+        self.centroids = kmeans(embeddings, int(np.sqrt(len(self))) or 1, iterations)
+        assignments = assign(embeddings, self.centroids)
+        # rows are stored per cluster, so every inverted list is a contiguous slice of list_rows
+        self.list_rows = np.argsort(assignments, kind='stable')
+        self.list_offsets = np.searchsorted(assignments[self.list_rows], np.arange(len(self.centroids) + 1))
+
+    def search(self, query_embedding, top=1, normalized_query=None):
+        query = self.prepare([query_embedding])
+        clusters = top_k(self.centroids @ query[0], self.probes)
+        rows = np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in clusters])
+        scores = self.prepared_scores(query, rows)
+        if self.lexical_weight and normalized_query is not None:
+            scores = self.hybrid_scores(scores, [normalized_query], rows)
+        scores = scores[0]
+
+        order = np.argsort(-scores, kind='stable')
+        _, first = np.unique(self.row_qa_positions[rows[order]], return_index=True)
+        best = order[np.sort(first)[:top]]
+        return [(int(self.qa_ids[rows[idx]]), float(scores[idx])) for idx in best]
+
+    def search_multiple(self, query_embeddings, top=1, normalized_queries=None):
+        normalized_queries = normalized_queries or [None] * len(query_embeddings)
+        return [self.search(query_embedding, top, normalized_query)
+                for query_embedding, normalized_query in zip(query_embeddings, normalized_queries)]
+
+
+# Embeddings are projected onto the top right singular vectors of the uncentered question embeddings. Without
+# centering the projection approximates the dot products between embeddings, but the discarded components and the
+# normalization after the projection shift the scores, see the score drift of the index-report command.
+class Projection:
+    def __init__(self, components, retained):
+        self.components = components
+        self.retained = retained
+
+    @property
+    def dimensions(self):
+        return self.components.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.components.nbytes
+
+    @classmethod
+    def fit(cls, embeddings, dimensions, sample_size=20000):
+        embeddings = normalize_vectors(embeddings)
+        if dimensions >= min(embeddings.shape):
+            return None
+        if len(embeddings) > sample_size:
+            embeddings = embeddings[np.random.RandomState(0).choice(len(embeddings), sample_size, replace=False)]
+        _, singular_values, vt = np.linalg.svd(embeddings, full_matrices=False)
+        energy = singular_values ** 2
+        return cls(np.ascontiguousarray(vt[:dimensions].T, dtype=np.float32),
+                   float(energy[:dimensions].sum() / energy.sum()))
+
+    def apply(self, embeddings):
+        return np.array(embeddings, dtype=np.float32, ndmin=2) @ self.components
+
+
+indexes = {}
+index_locks = {}
+indexes_lock = threading.Lock()
+counters = {'exact_matches': 0, 'semantic_matches': 0}
+counters_lock = threading.Lock()
+
+
+def get_index(chatbot):
+    index = indexes.get(chatbot.id)
+    if index is None or index.version != chatbot.kb_version:
+        # a rebuild only blocks the requests of its own chatbot
+        with get_index_lock(chatbot.id):
+            index = indexes.get(chatbot.id)
+            if index is None or index.version != chatbot.kb_version:
+                index = build_index(chatbot)
+                if index is not None:
+                    indexes[chatbot.id] = index
+    return index
+
+
+def get_index_lock(chatbot_id):
+    with indexes_lock:
+        return index_locks.setdefault(chatbot_id, threading.Lock())
+
+
+def build_index(chatbot):
+    qa_ids, texts, embeddings = load_question_embeddings(chatbot.id)
+    if embeddings is None:
+        app.logger.warning(f'Unable to build the question index for chatbot {chatbot.id}')
+        return None
+
+    index_type = chatbot.index_type or 'auto'
+    if index_type == 'auto':
+        index_type = 'ivf' if len(qa_ids) >= app.config['IVF_MIN_QUESTIONS'] else 'exact'
+    precision = chatbot.index_precision or 'float32'
+
+    app.logger.debug(f'Building {index_type} {precision} question index for chatbot {chatbot.id} with {len(qa_ids)} questions')
+    lexical_weight = app.config['HYBRID_LEXICAL_WEIGHT']
+    if index_type == 'ivf' and len(qa_ids) > 0:
+        index = IVFIndex(chatbot.id, chatbot.kb_version, qa_ids, embeddings, precision, texts, lexical_weight,
+                         chatbot.index_dimensions, chatbot.index_probes or app.config['IVF_PROBES'],
+                         app.config['IVF_KMEANS_ITERATIONS'])
+    else:
+        index = QuestionIndex(chatbot.id, chatbot.kb_version, qa_ids, embeddings, precision, texts, lexical_weight,
+                              chatbot.index_dimensions)
+    if index.projection:
+        app.logger.info(f'Question embeddings of chatbot {chatbot.id} projected to {index.projection.dimensions} '
+                        f'dimensions, retaining {100 * index.projection.retained:.2f}% of their energy')
+    return index
+
+
+# qas without answers can not answer a question, so their questions are left out of the index
+def load_question_embeddings(chatbot_id):
+    questions = Question.query\
+        .with_entities(Question.qa_id, Question.text)\
+        .filter_by(chatbot_id=chatbot_id)\
+        .filter(db.session.query(Answer.id).filter(Answer.qa_id == Question.qa_id).exists())\
+        .order_by(Question.qa_id, Question.id)\
+        .all()
+
+    texts = normalize_multiple([q.text for q in questions])
+    embeddings = encode(texts)
+    if len(embeddings) != len(questions):
+        return None, None, None
+
+    return [q.qa_id for q in questions], texts, embeddings
+
+
+def match_questions(index, normalized_questions, embeddings, top=1, block_size=1024):
+    if index is None or len(index) == 0:
+        return [[] for _ in normalized_questions]
+
+    # queries are scored in blocks, so the score matrix of a large import never has more than block_size rows
+    results = []
+    for start in range(0, len(normalized_questions), block_size):
+        results += index.search_multiple(embeddings[start:start + block_size], top,
+                                         normalized_questions[start:start + block_size])
+    for result, normalized_question in zip(results, normalized_questions):
+        qa_id = index.match_exact(normalized_question)
+        if qa_id is not None:
+            result[:] = [(qa_id, 1.0)] + [r for r in result if r[0] != qa_id][:top - 1]
+    return results
+
+
+def evaluate_index(reference, index, query_embeddings, threshold=None):
+    started = time.perf_counter()
+    results = index.search_multiple(query_embeddings, 1)
+    elapsed = time.perf_counter() - started
+    expected = reference.search_multiple(query_embeddings, 1)
+
+    matches = [bool(r) and bool(e) and r[0][0] == e[0][0] for r, e in zip(results, expected)]
+    drifts = [r[0][1] - e[0][1] for r, e in zip(results, expected) if r and e]
+    deltas = [abs(drift) for drift in drifts]
+    # the share of queries that the threshold would answer with one index and not with the other
+    flips = [(r[0][1] >= threshold) != (e[0][1] >= threshold) for r, e in zip(results, expected) if r and e] \
+        if threshold is not None else []
+    return {
+        'dimensions': index.vectors.shape[1] if index.vectors.ndim == 2 else 0,
+        'memory_kb': index.nbytes / 1000,
+        'top1_agreement': 100.0 * sum(matches) / len(matches) if matches else 100.0,
+        'mean_score_delta': float(np.mean(deltas)) if deltas else 0.0,
+        'max_score_delta': float(np.max(deltas)) if deltas else 0.0,
+        'mean_score_drift': float(np.mean(drifts)) if drifts else 0.0,
+        'threshold_flips': 100.0 * sum(flips) / len(flips) if flips else 0.0,
+        'search_ms': 1000 * elapsed / len(query_embeddings) if len(query_embeddings) else 0.0
+    }
+
+
+def invalidate_index(chatbot_id):
+    Chatbot.query.filter_by(id=chatbot_id)\
+        .update({Chatbot.kb_version: db.func.coalesce(Chatbot.kb_version, 0) + 1}, synchronize_session=False)
+    indexes.pop(chatbot_id, None)
+
+
+def count_matches(name, count=1):
+    with counters_lock:
+        counters[name] += count
+
+
+def normalize_vectors(vectors):
+    vectors = np.array(vectors, dtype=np.float32, order='C', ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def quantize(embeddings, precision):
+    if precision == 'float16':
+        return embeddings.astype(np.float16), None
+    if precision == 'int8':
+        # every vector gets its own scale, so the full int8 range is used regardless of its largest component
+        scales = np.abs(embeddings).max(axis=1) / 127 if len(embeddings) else np.zeros(0, dtype=np.float32)
+        scales[scales == 0] = 1
+        return np.round(embeddings / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return embeddings, None
+
+
+def dot(queries, vectors, scales=None, block_size=4096):
+    if vectors.dtype == np.float32:
+        return queries @ vectors.T
+
+    # numpy has no float16 or int8 matrix kernels, so blocks are widened to float32 while scoring
+    scores = np.empty((len(queries), len(vectors)), dtype=np.float32)
+    for start in range(0, len(vectors), block_size):
+        scores[:, start:start + block_size] = queries @ vectors[start:start + block_size].astype(np.float32).T
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def top_k(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def kmeans(vectors, k, iterations):
+    rng = np.random.RandomState(0)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), k * 64), replace=False)]
+    centroids = sample[rng.choice(len(sample), k, replace=False)]
+
+    for _ in range(iterations):
+        assignments = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = np.bincount(assignments, minlength=k) == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize_vectors(sums)
+
+    return centroids
+
+
+def assign(vectors, centroids, block_size=4096):
+    return np.concatenate([np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), block_size)])
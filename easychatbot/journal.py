@@ -0,0 +1,177 @@
+import atexit
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import current_app as app
+from flask import abort
+from easychatbot.database import db, insert_many
+from easychatbot.database.models import Message
+from easychatbot.daily_stats import update_daily_stats
+from easychatbot.history import record_message
+from easychatbot.storage import FileLock
+
+
+message_journal = None
+
+
+def init_journal():
+    global message_journal
+    message_journal = MessageJournal(app._get_current_object(), app.config['MESSAGE_JOURNAL_SIZE'],
+                                     app.config['MESSAGE_JOURNAL_BATCH_SIZE'],
+                                     app.config['MESSAGE_JOURNAL_FLUSH_SECONDS'],
+                                     app.config['MESSAGE_JOURNAL_PUT_TIMEOUT'],
+                                     app.config['MESSAGE_JOURNAL_ATTEMPTS'],
+                                     app.config['MESSAGE_JOURNAL_DEAD_LETTER'])
+
+
+def new_message(session_id, chatbot_id, user_id, text, normalized_text=None, score=None,
+                is_welcome=False, is_no_answer=False):
+    return {
+        'id': None,
+        'session_id': session_id,
+        'chatbot_id': chatbot_id,
+        'user_id': user_id,
+        'text': text,
+        'normalized_text': normalized_text,
+        'score': score,
+        'is_welcome': is_welcome,
+        'is_no_answer': is_no_answer,
+        'created': datetime.utcnow()
+    }
+
+
+def journal_messages(rows):
+    message_journal.append(rows)
+    for row in rows:
+        record_message(row)
+    return rows
+
+
+def get_pending_messages(session_id):
+    return message_journal.pending_messages(session_id) if message_journal else []
+
+
+# Messages are queued as rows of the messages table and inserted by a background thread in batches of about
+# batch_size rows, one transaction per batch that also updates the daily statistics. The rows of one append, such as a
+# question and its answer, are queued together and stored in the same batch. When the queue already holds max_size
+# appends, requests wait up to put_timeout seconds for the writer to catch up before they are rejected. Queued rows
+# stay readable per session until committed. A batch that still fails after max_attempts is written row by row, and
+# the rows that cannot be stored are appended to the dead letter file as json lines instead of blocking the journal.
+class MessageJournal:
+    def __init__(self, flask_app, max_size, batch_size, flush_interval, put_timeout, max_attempts, dead_letter_path):
+        self.flask_app = flask_app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path
+        self.queue = queue.Queue(max_size)
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.pending = {}
+        self.counters = {'messages': 0, 'batches': 0, 'failed_batches': 0, 'rejected': 0, 'dead_letters': 0,
+                         'max_batch_size': 0}
+        self.thread = threading.Thread(target=self.__run, name='message-journal', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def append(self, rows):
+        with self.lock:
+            for row in rows:
+                self.pending.setdefault(row['session_id'], []).append(row)
+        try:
+            self.queue.put(rows, timeout=self.put_timeout)
+        except queue.Full:
+            self.__forget(rows)
+            with self.lock:
+                self.counters['rejected'] += len(rows)
+            abort(503, 'Too many messages are waiting to be stored, please try again later.')
+
+    def pending_messages(self, session_id):
+        with self.lock:
+            return list(self.pending.get(session_id, []))
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['queued'] = sum(len(rows) for rows in self.pending.values())
+        return stats
+
+    def flush(self):
+        while True:
+            rows = self.__take(block=False)
+            if not rows:
+                return
+            if not self.__write(rows):
+                self.__isolate(rows)
+
+    def __take(self, block):
+        rows = []
+        try:
+            rows += self.queue.get(timeout=self.flush_interval) if block else self.queue.get_nowait()
+            while len(rows) < self.batch_size:
+                rows += self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        return rows
+
+    def __write(self, rows):
+        with self.write_lock, self.flask_app.app_context():
+            try:
+                values = [{key: value for key, value in row.items() if key != 'id'} for row in rows]
+                ids = insert_many(Message.__table__, values)
+                update_daily_stats(rows)
+                db.session.commit()
+            except Exception:
+                self.flask_app.logger.exception(f'Unable to store {len(rows)} messages')
+                db.session.rollback()
+                with self.lock:
+                    self.counters['failed_batches'] += 1
+                return False
+
+        for row, id in zip(rows, ids):
+            row['id'] = id
+        self.__forget(rows)
+        with self.lock:
+            self.counters['messages'] += len(rows)
+            self.counters['batches'] += 1
+            self.counters['max_batch_size'] = max(self.counters['max_batch_size'], len(rows))
+        return True
+
+    def __isolate(self, rows):
+        for row in rows:
+            if len(rows) == 1 or not self.__write([row]):
+                self.__dead_letter(row)
+
+    def __dead_letter(self, row):
+        self.flask_app.logger.error(f'Moving message of session {row["session_id"]} to {self.dead_letter_path}')
+        try:
+            with FileLock(self.dead_letter_path + '.lock'), open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(row, default=str) + '\n')
+        except Exception:
+            self.flask_app.logger.exception(f'Unable to write to {self.dead_letter_path}')
+        self.__forget([row])
+        with self.lock:
+            self.counters['dead_letters'] += 1
+
+    def __forget(self, rows):
+        with self.lock:
+            for row in rows:
+                session_rows = self.pending.get(row['session_id'])
+                if session_rows is not None:
+                    session_rows.remove(row)
+                    if not session_rows:
+                        del self.pending[row['session_id']]
+
+    def __run(self):
+        while True:
+            rows = self.__take(block=True)
+            attempts = 1
+            while rows and not self.__write(rows):
+                if attempts >= self.max_attempts:
+                    self.__isolate(rows)
+                    break
+                attempts += 1
+                time.sleep(self.flush_interval)
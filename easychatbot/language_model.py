@@ -1,45 +1,110 @@
 import os.path
 import pickle
-from sentence_transformers import SentenceTransformer
+import threading
+import time
+import numpy as np
 from flask import current_app as app
-from .core import LimitedSizeDict
+from flask import abort
+from .core import EncodeBatcher, LRUCache
+from .encoder_service import EncoderClient, load_sentence_transformer
+from .storage import VectorStore
 
+try:
+    from importlib import metadata
+except ImportError:
+    import importlib_metadata as metadata
 
-sentence_transformer = SentenceTransformer(app.config['LANGUAGE_MODEL_NAME'])
+
+sentence_transformer = None
+encoder = None
+ready = threading.Event()
+
+
+def init_language_model():
+    thread = threading.Thread(target=load_language_model, args=(app._get_current_object(),),
+                              name='language-model-loader', daemon=True)
+    thread.start()
+
+
+def load_language_model(flask_app):
+    global sentence_transformer, encoder
+    started = time.perf_counter()
+    try:
+        from .normalizer import load_resources
+        load_resources()
+        flask_app.startup_timings['nlp_resources'] = round(time.perf_counter() - started, 3)
+
+        if flask_app.config['ENCODER_SERVICE']:
+            encoder = EncoderClient(flask_app.config['ENCODER_SOCKET'], flask_app.config['ENCODER_TIMEOUT'],
+                                    flask_app.config['ENCODE_BATCH_SIZE'])
+        else:
+            sentence_transformer = load_sentence_transformer(flask_app.config, flask_app.logger)
+            encoder = EncodeBatcher(sentence_transformer.encode, flask_app.config['ENCODE_BATCH_SIZE'],
+                                    flask_app.config['ENCODE_BATCH_WAIT_MS'] / 1000, flask_app.logger)
+        flask_app.startup_timings['language_model_load'] = round(time.perf_counter() - started, 3)
+        flask_app.logger.info(f'Language model ready in {time.perf_counter() - started:.3f}s')
+    except Exception:
+        flask_app.logger.exception('Unable to load the language model')
+    finally:
+        ready.set()
+
+
+def wait_until_ready(timeout=None):
+    return ready.wait(timeout)
 
 
 def encode(texts):
-    if not sentence_transformer:
+    if not wait_until_ready(app.config['LANGUAGE_MODEL_WAIT_SECONDS']):
+        abort(503, 'The language model is still loading.')
+    if not encoder:
         app.logger.warning('Unable to encode because the model was not correctly loaded')
         return []
     if len(texts) == 0:
         return []
 
-    new_texts = list(set(text for text in texts if text not in encoding_cache))
+    embeddings = {text: encoding_memory_cache.get(text) for text in set(texts)}
+    stored_texts = [text for text, embedding in embeddings.items() if embedding is None]
+    for text in stored_texts:
+        embedding = encoding_cache.get(text)
+        if embedding is not None:
+            embeddings[text] = encoding_memory_cache[text] = np.array(embedding)
+    new_texts = [text for text, embedding in embeddings.items() if embedding is None]
 
     if len(new_texts) > 0:
         app.logger.debug(f'Encoding {len(new_texts)} texts')
-        new_embeddings = sentence_transformer.encode(new_texts)
+        new_embeddings = encoder.encode(new_texts)
+        embeddings.update(zip(new_texts, new_embeddings))
+        # the embeddings are rows of the batch array, a cached row would keep the whole batch alive
+        encoding_memory_cache.update((text, np.array(embedding)) for text, embedding in zip(new_texts, new_embeddings))
         encoding_cache.update(zip(new_texts, new_embeddings))
-        save_encoding_cache()
 
-    return [encoding_cache[text] for text in texts]
+    return [embeddings[text] for text in texts]
 
 
 def load_encoding_cache():
+    path = os.path.join(app.config['DATA_PATH'], get_encoding_cache_name())
+    cache = VectorStore(path, app.config['ENCODING_CACHE_SIZE'])
+
+    # the encoding cache used to be a single pickle that was rewritten on every change
     path = os.path.join(app.config['DATA_PATH'], 'encoding_cache.pkl')
-    if os.path.exists(path):
+    if os.path.exists(path) and len(cache) == 0 and not app.config['LANGUAGE_MODEL_QUANTIZE']:
         with open(path, 'rb') as f:
-            cache = LimitedSizeDict(size_limit=1000000)
-            cache.update(pickle.load(f))
-            return cache
-    return LimitedSizeDict(size_limit=1000000)
+            cache.update(pickle.load(f).items())
+        os.remove(path)
 
+    return cache
 
-def save_encoding_cache():
-    path = os.path.join(app.config['DATA_PATH'], 'encoding_cache.pkl')
-    with open(path, 'wb') as f:
-        pickle.dump({key: encoding_cache[key] for key in encoding_cache.keys()}, f)
+
+def get_encoding_cache_name():
+    # the quantized model produces slightly different embeddings, so they are never mixed with the float ones, and its
+    # weights are quantized at every start, which another torch version may round differently
+    if not app.config['LANGUAGE_MODEL_QUANTIZE']:
+        return 'encoding_cache'
+    try:
+        return f'encoding_cache-int8-torch{metadata.version("torch")}'
+    except metadata.PackageNotFoundError:
+        return 'encoding_cache-int8'
 
 
 encoding_cache = load_encoding_cache()
+encoding_memory_cache = LRUCache(app.config['ENCODING_CACHE_BYTES'])
@@ -0,0 +1,33 @@
+import math
+from collections import Counter
+import numpy as np
+
+
+class LexicalIndex:
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.size = len(texts)
+        documents = [text.split() for text in texts]
+        lengths = np.array([len(document) for document in documents], dtype=np.float32)
+        average_length = float(lengths.mean()) if self.size and lengths.mean() > 0 else 1.0
+
+        postings = {}
+        for row, document in enumerate(documents):
+            for term, frequency in Counter(document).items():
+                postings.setdefault(term, []).append((row, frequency))
+
+        # bm25 ignores the query term frequency, so the full weight of every posting can be computed up front
+        self.postings = {}
+        for term, entries in postings.items():
+            rows = np.array([row for row, _ in entries], dtype=np.int64)
+            frequencies = np.array([frequency for _, frequency in entries], dtype=np.float32)
+            idf = math.log(1 + (self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+            norms = k1 * (1 - b + b * lengths[rows] / average_length)
+            self.postings[term] = rows, (idf * frequencies * (k1 + 1) / (frequencies + norms)).astype(np.float32)
+
+    def scores(self, text):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(text.split()):
+            if term in self.postings:
+                rows, weights = self.postings[term]
+                scores[rows] += weights
+        return scores
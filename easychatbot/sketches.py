@@ -0,0 +1,50 @@
+import hashlib
+import numpy as np
+
+
+# A HyperLogLog sketch estimates the number of distinct values it has seen in a fixed 2^precision bytes. Sketches
+# merge by taking the maximum of every register, so the sketches of single days combine into any date range.
+class HyperLogLog:
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    @classmethod
+    def from_bytes(cls, data, precision=12):
+        if not data:
+            return cls(precision)
+        registers = np.frombuffer(data, dtype=np.uint8).copy()
+        return cls(int(len(registers)).bit_length() - 1, registers)
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    def add(self, value):
+        if value is None:
+            return
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        register = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - remaining.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('Only sketches with the same precision can be merged.')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        # small cardinalities are estimated far better by counting the empty registers
+        if estimate <= 2.5 * size and empty > 0:
+            estimate = size * np.log(size / empty)
+        return int(round(estimate))
@@ -0,0 +1,234 @@
+import os
+import json
+import threading
+import time
+import atexit
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Vectors are appended to a flat float32 file that is read through numpy.memmap, keys are appended to a json
+# lines file as [row, key] after a header line with the dimensions. When the store grows beyond size_limit
+# it is rewritten with only the most recent entries.
+class VectorStore:
+    def __init__(self, path, size_limit=None):
+        self.vectors_path = path + '.f32'
+        self.keys_path = path + '.keys'
+        self.size_limit = size_limit
+        self.lock = threading.RLock()
+        self.rows = None
+        self.dimensions = None
+        self.vectors = None
+        self.inode = None
+
+    def __len__(self):
+        with self.lock:
+            self.__ensure_loaded()
+            return len(self.rows)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        vector = self.get(key)
+        if vector is None:
+            raise KeyError(key)
+        return vector
+
+    def get(self, key):
+        with self.lock:
+            self.__ensure_loaded()
+            row = self.rows.get(key)
+            if row is None:
+                return None
+            if self.vectors is None or row >= len(self.vectors):
+                self.__map()
+                # the store may have been compacted by another process, which moves the rows of the keys
+                row = self.rows.get(key)
+                if row is None or row >= len(self.vectors):
+                    return None
+            return self.vectors[row]
+
+    def update(self, items):
+        items = [(key, np.asarray(vector, dtype=np.float32)) for key, vector in items]
+        if not items:
+            return
+
+        with self.lock, FileLock(self.keys_path + '.lock'):
+            self.__ensure_loaded(check_inode=True)
+            dimensions = self.dimensions or len(items[0][1])
+            if self.dimensions is None:
+                with open(self.keys_path, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps({'dimensions': dimensions}) + '\n')
+                self.dimensions = dimensions
+                self.inode = os.stat(self.keys_path).st_ino
+
+            with open(self.vectors_path, 'ab') as f:
+                first_row = f.seek(0, os.SEEK_END) // (4 * dimensions)
+                f.truncate(first_row * 4 * dimensions)
+                f.write(b''.join(vector.tobytes() for _, vector in items))
+            truncate_partial_line(self.keys_path)
+            with open(self.keys_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps([first_row + i, key]) + '\n' for i, (key, _) in enumerate(items)))
+            self.rows.update((key, first_row + i) for i, (key, _) in enumerate(items))
+
+            if self.size_limit is not None and len(self.rows) > self.size_limit:
+                self.__compact(self.size_limit * 3 // 4)
+
+    def __ensure_loaded(self, check_inode=False):
+        if self.rows is None or (check_inode and self.__inode() != self.inode):
+            self.__load()
+
+    def __inode(self):
+        return os.stat(self.keys_path).st_ino if os.path.exists(self.keys_path) else None
+
+    def __load(self):
+        self.rows, self.dimensions, self.vectors = {}, None, None
+        self.inode = self.__inode()
+        if self.inode is None:
+            return
+
+        with open(self.keys_path, 'r', encoding='utf-8') as f:
+            header = f.readline()
+            if not header.endswith('\n'):
+                return
+            self.dimensions = json.loads(header)['dimensions']
+            stored_rows = os.path.getsize(self.vectors_path) // (4 * self.dimensions) \
+                if os.path.exists(self.vectors_path) else 0
+            for line in f:
+                # a partially written last line or a key without its vector is ignored
+                if not line.endswith('\n'):
+                    break
+                try:
+                    row, key = json.loads(line)
+                except ValueError:
+                    continue
+                if row < stored_rows:
+                    self.rows[key] = row
+
+    def __map(self):
+        if self.__inode() != self.inode:
+            self.__load()
+        rows = os.path.getsize(self.vectors_path) // (4 * self.dimensions) if os.path.exists(self.vectors_path) else 0
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dimensions)) \
+            if rows else np.zeros((0, self.dimensions or 0), dtype=np.float32)
+
+    def __compact(self, keep):
+        self.__map()
+        newest = sorted(self.rows.items(), key=lambda item: item[1])[-keep:]
+        with open(self.vectors_path + '.tmp', 'wb') as f:
+            for _, row in newest:
+                f.write(self.vectors[row].tobytes())
+        with open(self.keys_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'dimensions': self.dimensions}) + '\n')
+            f.write(''.join(json.dumps([i, key]) + '\n' for i, (key, _) in enumerate(newest)))
+
+        self.vectors = None
+        os.replace(self.vectors_path + '.tmp', self.vectors_path)
+        os.replace(self.keys_path + '.tmp', self.keys_path)
+        self.__load()
+
+
+# Entries are appended to a json lines file as [key, value] by a background thread. When the file holds more than
+# twice the number of live entries of the cache it backs, it is rewritten with only the live entries.
+class WriteBehindLog:
+    def __init__(self, path, flush_interval, cache, logger, min_compact_lines=10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.cache = cache
+        self.logger = logger
+        self.min_compact_lines = min_compact_lines
+        self.lock = threading.Lock()
+        self.pending = []
+        self.lines = 0
+        self.thread = threading.Thread(target=self.__run, name='write-behind-log', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def load(self):
+        items = []
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break
+                    try:
+                        key, value = json.loads(line)
+                    except ValueError:
+                        continue
+                    items.append((key, value))
+        self.lines = len(items)
+        return items
+
+    def append(self, key, value):
+        with self.lock:
+            self.pending.append((key, value))
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return
+
+        with FileLock(self.path + '.lock'):
+            if os.path.exists(self.path):
+                truncate_partial_line(self.path)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps([key, value]) + '\n' for key, value in pending))
+            self.lines += len(pending)
+
+            if self.lines > max(2 * len(self.cache), self.min_compact_lines):
+                self.__compact()
+
+    def __compact(self):
+        items = self.cache.items()
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps([key, value]) + '\n' for key, value in items))
+        os.replace(self.path + '.tmp', self.path)
+        self.lines = len(items)
+
+    def __run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception(f'Unable to flush {self.path}')
+
+
+def truncate_partial_line(path, chunk_size=4096):
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline >= 0:
+                if start + newline + 1 != end:
+                    f.truncate(start + newline + 1)
+                return
+            position = start
+        f.truncate(0)
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        if fcntl:
+            self.file = open(self.path, 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if self.file:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
@@ -1,52 +1,385 @@
-import math
-import scipy.spatial
+import atexit
+import threading
 import numpy as np
 from datetime import datetime
 from collections import OrderedDict
 from flask import current_app as app
 from flask import session, g
 from easychatbot.database import db
-from easychatbot.database.models import Suggestion
-from easychatbot.normalization import normalize_single, normalize_multiple
-from easychatbot.language_model import encode
-
-
-def handle_suggestion(chatbot_id, question, score, is_no_answer):
-    normalized_question = normalize_single(question)
-    suggestion = Suggestion.query\
-        .filter_by(chatbot_id=chatbot_id, normalized_text=normalized_question)\
-        .first()
-
-    if is_no_answer:
-        suggestion = suggestion or Suggestion(
-                chatbot_id=chatbot_id,
-                text=question,
-                normalized_text=normalized_question,
-                count=0,
-                score=0)
-        suggestion.count += 1
-        suggestion.score = (suggestion.score * (suggestion.count - 1) + score) / suggestion.count
-        db.session.add(suggestion)
-    elif suggestion:
-        db.session.delete(suggestion)
-
-
-def get_question_suggestions(chatbot_id, queries):
-    suggestions = Suggestion.query\
+from easychatbot.database.models import Chatbot, Suggestion
+from easychatbot.normalization import normalize_multiple
+from easychatbot.language_model import encode, wait_until_ready
+from easychatbot.index import get_index, normalize_vectors, top_k
+
+
+suggestion_aggregator = None
+
+
+def init_suggestions():
+    global suggestion_aggregator
+    suggestion_aggregator = SuggestionAggregator(app._get_current_object(), app.config['SUGGESTION_FLUSH_SECONDS'],
+                                                 app.config['SUGGESTION_FLUSH_EVENTS'],
+                                                 app.config['SUGGESTION_FLUSH_ATTEMPTS'])
+
+
+def handle_suggestion(chatbot_id, question, normalized_question, score, is_no_answer):
+    suggestion_aggregator.add(chatbot_id, question, normalized_question, score, is_no_answer)
+
+
+def apply_suggestions(chatbot_id, deltas):
+    suggestion_index = get_suggestion_index(chatbot_id)
+    with suggestion_index.lock:
+        if not sync_suggestion_index(chatbot_id, suggestion_index):
+            return False
+        if len(suggestion_index) == 0 and not any(delta.count for _, delta in deltas):
+            return True
+
+        embeddings = encode([normalized_text for normalized_text, _ in deltas])
+        if len(embeddings) != len(deltas):
+            return False
+        threshold = app.config['SUGGESTION_CLUSTER_THRESHOLD']
+
+        try:
+            deleted, increments = set(), {}
+            for (normalized_text, delta), embedding in zip(deltas, normalize_vectors(embeddings)):
+                if delta.deleted:
+                    # an answered question means the topic of the clusters around it is covered by the knowledge base
+                    ids = suggestion_index.within(embedding, threshold)
+                    suggestion_index.remove(ids)
+                    deleted.update(ids)
+                    for id in ids:
+                        increments.pop(id, None)
+                if delta.count:
+                    # unanswered questions join the nearest cluster, or start a new one when none is close enough
+                    id, similarity = suggestion_index.nearest(embedding)
+                    if id is not None and similarity >= threshold:
+                        cluster = suggestion_index.clusters[id]
+                        add_to_cluster(cluster, cluster.vector, delta.text, normalized_text, embedding, delta.count,
+                                       delta.score)
+                        count, score = increments.get(id, (0, 0.0))
+                        increments[id] = (count + delta.count, score + delta.score)
+                    else:
+                        cluster = SuggestionCluster(None, delta.text, normalized_text, 0, 0.0, None)
+                        add_to_cluster(cluster, embedding, delta.text, normalized_text, embedding, delta.count,
+                                       delta.score)
+                        cluster.id = insert_suggestion(chatbot_id, cluster)
+                    suggestion_index.put(cluster)
+
+            if deleted:
+                Suggestion.query.filter(Suggestion.id.in_(deleted)).delete(synchronize_session=False)
+            if increments:
+                db.session.execute(upsert_suggestion, [
+                    {'id': id, 'chatbot_id': chatbot_id, 'text': suggestion_index.clusters[id].text,
+                     'normalized_text': suggestion_index.clusters[id].normalized_text, 'count': count,
+                     'score': score / count, 'centroid': suggestion_index.clusters[id].centroid}
+                    for id, (count, score) in increments.items()])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            suggestion_index.clear()
+            raise
+        return True
+
+
+# the counts of clusters that were also changed by other processes are added to the stored counts, a cluster that
+# was deleted in the meantime is stored again with only the new occurrences
+upsert_suggestion = db.text(
+    'INSERT INTO suggestions (id, chatbot_id, text, normalized_text, count, score, centroid) '
+    'VALUES (:id, :chatbot_id, :text, :normalized_text, :count, :score, :centroid) '
+    'ON CONFLICT (id) DO UPDATE SET '
+    'score = (coalesce(suggestions.score, 0) * coalesce(suggestions.count, 0) + excluded.score * excluded.count) '
+    '/ (coalesce(suggestions.count, 0) + excluded.count), '
+    'count = coalesce(suggestions.count, 0) + excluded.count, '
+    'text = excluded.text, normalized_text = excluded.normalized_text, centroid = excluded.centroid')
+
+
+def insert_suggestion(chatbot_id, cluster):
+    result = db.session.execute(Suggestion.__table__.insert(), {
+        'chatbot_id': chatbot_id, 'text': cluster.text, 'normalized_text': cluster.normalized_text,
+        'count': cluster.count, 'score': cluster.score, 'centroid': cluster.centroid})
+    return result.inserted_primary_key[0]
+
+
+def add_to_cluster(suggestion, centroid, question, normalized_question, embedding, count=1, score=0.0):
+    previous_count = suggestion.count or 0
+    suggestion.count = previous_count + count
+    suggestion.score = ((suggestion.score or 0) * previous_count + score) / suggestion.count
+    mean = np.frombuffer(suggestion.centroid, dtype=np.float32) if suggestion.centroid else centroid
+    mean = (mean * previous_count + embedding * count) / suggestion.count
+    suggestion.centroid = mean.astype(np.float32).tobytes()
+
+    # the representative text of a cluster is the question closest to its centroid
+    if previous_count > 0 and suggestion.normalized_text != normalized_question:
+        representative = encode([suggestion.normalized_text])
+        if len(representative) == 0 or embedding @ mean > normalize_vectors(representative)[0] @ mean:
+            suggestion.text = question
+            suggestion.normalized_text = normalized_question
+
+
+def get_question_suggestions(chatbot_id, queries, top=10, aggregation='max'):
+    if not queries:
+        # suggestions asked often with a low score come first
+        rank = (1 - Suggestion.score / db.func.log2(Suggestion.count + 1)).label('rank')
+        suggestions = Suggestion.query\
+            .with_entities(Suggestion.text, rank, Suggestion.count)\
+            .filter_by(chatbot_id=chatbot_id)\
+            .order_by(rank.desc())\
+            .limit(top)\
+            .all()
+        return [(s.text, s.rank, s.count) for s in suggestions]
+
+    query_embeddings = encode(normalize_multiple(queries))
+    if len(query_embeddings) == 0:
+        return []
+
+    # suggestions are compared in the same projected space as the questions of the chatbot
+    index = get_index(Chatbot.query.get(chatbot_id))
+    prepare = index.prepare if index else normalize_vectors
+
+    suggestion_index = get_suggestion_index(chatbot_id)
+    with suggestion_index.lock:
+        if not sync_suggestion_index(chatbot_id, suggestion_index):
+            return []
+        return suggestion_index.search(query_embeddings, top, aggregation, prepare)
+
+
+def sync_suggestion_index(chatbot_id, suggestion_index):
+    counts = Suggestion.query\
+        .with_entities(Suggestion.id, Suggestion.count)\
         .filter_by(chatbot_id=chatbot_id)\
         .all()
+    return suggestion_index.sync(counts, lambda ids: load_suggestions(chatbot_id, ids))
+
+
+def load_suggestions(chatbot_id, ids, max_ids=500):
+    query = Suggestion.query\
+        .with_entities(Suggestion.id, Suggestion.text, Suggestion.normalized_text, Suggestion.count,
+                       Suggestion.score, Suggestion.centroid)\
+        .filter_by(chatbot_id=chatbot_id)
+    if len(ids) <= max_ids:
+        return query.filter(Suggestion.id.in_(ids)).all()
+    ids = set(ids)
+    return [s for s in query.all() if s.id in ids]
+
+
+def get_suggestion_index(chatbot_id):
+    with suggestion_indexes_lock:
+        return suggestion_indexes.setdefault(chatbot_id, SuggestionIndex())
+
+
+class SuggestionCluster:
+    def __init__(self, id, text, normalized_text, count, score, centroid, vector=None):
+        self.id = id
+        self.text = text
+        self.normalized_text = normalized_text
+        self.count = count
+        self.score = score
+        self.centroid = centroid
+        self.vector = vector
+
+
+# Keeps the suggestion clusters of a chatbot and their normalized centroids between calls. Every change of a cluster
+# increases its count, so only the clusters whose stored count differs are read again. Clusters stored before
+# clustering was introduced have no centroid and are encoded once.
+class SuggestionIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clusters = {}
+        self.ids = []
+        self.positions = {}
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.prepare = None
+        self.vectors = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sync(self, counts, load):
+        changed = [id for id, count in counts if id not in self.clusters or self.clusters[id].count != count]
+        removed = self.clusters.keys() - set(id for id, _ in counts)
+        for id in removed:
+            del self.clusters[id]
+
+        if changed:
+            suggestions = load(changed)
+            legacy = [s for s in suggestions if not s.centroid]
+            embeddings = encode([s.normalized_text for s in legacy]) if legacy else []
+            if len(embeddings) != len(legacy):
+                self.__rebuild()
+                return False
+            vectors = dict(zip([s.id for s in legacy], normalize_vectors(embeddings))) if legacy else {}
+            for s in suggestions:
+                vector = vectors[s.id] if s.id in vectors else self.__normalize(s.centroid)
+                self.clusters[s.id] = SuggestionCluster(s.id, s.text, s.normalized_text, s.count, s.score,
+                                                        s.centroid, vector)
+
+        if changed or removed:
+            self.__rebuild()
+        return True
+
+    def put(self, cluster):
+        cluster.vector = self.__normalize(cluster.centroid)
+        self.clusters[cluster.id] = cluster
+        if cluster.id in self.positions:
+            self.centroids[self.positions[cluster.id]] = cluster.vector
+        else:
+            self.positions[cluster.id] = len(self.ids)
+            self.ids.append(cluster.id)
+            self.centroids = np.vstack([self.centroids.reshape(-1, len(cluster.vector)), cluster.vector])
+        self.vectors = None
+
+    def remove(self, ids):
+        for id in ids:
+            self.clusters.pop(id, None)
+        self.__rebuild()
+
+    def clear(self):
+        self.clusters = {}
+        self.__rebuild()
+
+    def nearest(self, embedding):
+        if len(self) == 0:
+            return None, 0.0
+        similarities = self.centroids @ embedding
+        idx = int(np.argmax(similarities))
+        return self.ids[idx], float(similarities[idx])
+
+    def within(self, embedding, threshold):
+        if len(self) == 0:
+            return []
+        return [self.ids[idx] for idx in np.flatnonzero(self.centroids @ embedding >= threshold)]
+
+    def search(self, query_embeddings, top, aggregation='max', prepare=normalize_vectors):
+        if len(self) == 0:
+            return []
+        if self.vectors is None or prepare != self.prepare:
+            self.prepare, self.vectors = prepare, prepare(self.centroids)
+        similarities = self.prepare(query_embeddings) @ self.vectors.T
+        scores = similarities.mean(axis=0) if aggregation == 'mean' else similarities.max(axis=0)
+        return [(self.clusters[self.ids[idx]].text, max(0, float(scores[idx])), self.clusters[self.ids[idx]].count)
+                for idx in top_k(scores, top)]
+
+    def __rebuild(self):
+        self.ids = list(self.clusters)
+        self.positions = {id: position for position, id in enumerate(self.ids)}
+        self.centroids = np.array([cluster.vector for cluster in self.clusters.values()], dtype=np.float32) \
+            if self.clusters else np.zeros((0, 0), dtype=np.float32)
+        self.vectors = None
+
+    @staticmethod
+    def __normalize(centroid):
+        return normalize_vectors(np.frombuffer(centroid, dtype=np.float32))[0]
+
+
+class SuggestionDelta:
+    def __init__(self, text):
+        self.text = text
+        self.count = 0
+        self.score = 0.0
+        self.deleted = False
+        self.attempts = 0
+
+
+# Suggestion events are accumulated per (chatbot, normalized text) and written by a background thread every
+# flush_interval seconds, or sooner after flush_events events. An answered question discards the unanswered
+# occurrences accumulated before it, and keys are flushed in the order of their last event. Keys that could not be
+# flushed max_attempts times, for example because the language model failed to load, are dropped.
+class SuggestionAggregator:
+    def __init__(self, flask_app, flush_interval, flush_events, max_attempts):
+        self.flask_app = flask_app
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = OrderedDict()
+        self.events = 0
+        self.counters = {'events': 0, 'flushes': 0, 'flushed_keys': 0, 'failed_flushes': 0, 'dropped_keys': 0}
+        self.thread = threading.Thread(target=self.__run, name='suggestion-aggregator', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def add(self, chatbot_id, question, normalized_question, score, is_no_answer):
+        key = (chatbot_id, normalized_question)
+        with self.lock:
+            delta = self.pending.pop(key, None) or SuggestionDelta(question)
+            if is_no_answer:
+                delta.count += 1
+                delta.score += score
+            else:
+                delta.count, delta.score, delta.deleted = 0, 0.0, True
+            self.pending[key] = delta
+            self.events += 1
+            self.counters['events'] += 1
+            if self.events >= self.flush_events:
+                self.wakeup.set()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['pending_keys'] = len(self.pending)
+        return stats
+
+    def flush(self):
+        if not wait_until_ready(0):
+            return
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending, self.events = self.pending, OrderedDict(), 0
+            if not pending:
+                return
+
+            deltas = OrderedDict()
+            for (chatbot_id, normalized_text), delta in pending.items():
+                deltas.setdefault(chatbot_id, []).append((normalized_text, delta))
+
+            with self.flask_app.app_context():
+                for chatbot_id, chatbot_deltas in deltas.items():
+                    try:
+                        applied = apply_suggestions(chatbot_id, chatbot_deltas)
+                    except Exception:
+                        self.flask_app.logger.exception(f'Unable to flush the suggestions of chatbot {chatbot_id}')
+                        applied = False
+                    if not applied:
+                        self.__requeue(chatbot_id, chatbot_deltas)
+                    with self.lock:
+                        self.counters['flushes' if applied else 'failed_flushes'] += 1
+                        self.counters['flushed_keys'] += len(chatbot_deltas) if applied else 0
+
+    def __requeue(self, chatbot_id, deltas):
+        dropped = 0
+        with self.lock:
+            for normalized_text, delta in reversed(deltas):
+                key = (chatbot_id, normalized_text)
+                delta.attempts += 1
+                newer = self.pending.get(key)
+                if newer is not None and newer.deleted:
+                    continue
+                if delta.attempts >= self.max_attempts:
+                    dropped += 1
+                elif newer is None:
+                    self.pending[key] = delta
+                    self.pending.move_to_end(key, last=False)
+                else:
+                    newer.count += delta.count
+                    newer.score += delta.score
+                    newer.deleted = delta.deleted
+                    newer.attempts = delta.attempts
+            self.counters['dropped_keys'] += dropped
+        if dropped:
+            self.flask_app.logger.warning(f'Dropped {dropped} suggestion keys of chatbot {chatbot_id} after '
+                                          f'{self.max_attempts} failed flushes')
+
+    def __run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.flask_app.logger.exception('Unable to flush suggestions')
 
-    if len(suggestions) == 0:
-        return []
 
-    if queries and len(queries) > 0:
-        normalized_suggestions = [s.normalized_text for s in suggestions]
-        suggestion_embeddings = encode(normalized_suggestions)
-        normalized_queries = normalize_multiple(queries)
-        query_embeddings = encode(normalized_queries)
-        distances = scipy.spatial.distance.cdist(query_embeddings, suggestion_embeddings, "cosine")[0]
-        suggestions = zip([s.text for s in suggestions], [max(0, float(1.0 - d)) for d in distances])
-    else:
-        suggestions = zip([s.text for s in suggestions], [1 - s.score / math.log2(s.count + 1) for s in suggestions])
-
-    return list(sorted(suggestions, key=lambda x: x[1], reverse=True))
\ No newline at end of file
+suggestion_indexes = {}
+suggestion_indexes_lock = threading.Lock()
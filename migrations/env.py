@@ -0,0 +1,38 @@
+import os
+import sys
+from alembic import context
+from flask import Config
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import basedir, configs
+from easychatbot.database import db
+import easychatbot.database.models
+
+
+# the database is read from the same configuration as the application, without creating the application
+config = Config(os.path.join(basedir, 'instance'))
+config.from_object(configs[os.getenv('FLASK_CONFIG', 'default')])
+config.from_pyfile('config.py', silent=True)
+url = context.get_x_argument(as_dictionary=True).get('url', config['SQLALCHEMY_DATABASE_URI'])
+
+
+def run_migrations_offline():
+    context.configure(url=url, target_metadata=db.metadata, literal_binds=True, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=db.metadata, render_as_batch=True)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,69 @@
+"""add index settings, suggestion centroids and daily statistics
+
+Revision ID: 9b3e1f2c4a7d
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '9b3e1f2c4a7d'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+CHATBOT_COLUMNS = [
+    sa.Column('kb_version', sa.Integer, server_default='0'),
+    sa.Column('index_type', sa.String(16), server_default='auto'),
+    sa.Column('index_probes', sa.Integer),
+    sa.Column('index_precision', sa.String(16), server_default='float32'),
+    sa.Column('index_dimensions', sa.Integer),
+]
+
+
+# databases created by db.create_all() after these changes already have them, so only what is missing is added
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+
+    chatbot_columns = [c['name'] for c in inspector.get_columns('chatbots')]
+    with op.batch_alter_table('chatbots') as batch_op:
+        for column in CHATBOT_COLUMNS:
+            if column.name not in chatbot_columns:
+                batch_op.add_column(column)
+
+    if 'centroid' not in [c['name'] for c in inspector.get_columns('suggestions')]:
+        with op.batch_alter_table('suggestions') as batch_op:
+            batch_op.add_column(sa.Column('centroid', sa.LargeBinary))
+
+    if 'ix_messages_session_id_id' not in [i['name'] for i in inspector.get_indexes('messages')]:
+        op.create_index('ix_messages_session_id_id', 'messages', ['session_id', 'id'])
+
+    if 'message_daily_stats' not in tables:
+        op.create_table(
+            'message_daily_stats',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('chatbot_id', sa.Integer, sa.ForeignKey('chatbots.id')),
+            sa.Column('day', sa.Date),
+            sa.Column('message_count', sa.Integer),
+            sa.Column('bot_message_count', sa.Integer),
+            sa.Column('no_answer_count', sa.Integer),
+            sa.Column('score_sum', sa.Float),
+            sa.Column('user_sketch', sa.LargeBinary),
+            sa.Column('session_sketch', sa.LargeBinary),
+            sa.UniqueConstraint('chatbot_id', 'day'))
+        op.create_index('ix_message_daily_stats_chatbot_id', 'message_daily_stats', ['chatbot_id'])
+        op.create_index('ix_message_daily_stats_day', 'message_daily_stats', ['day'])
+
+
+def downgrade():
+    op.drop_table('message_daily_stats')
+    op.drop_index('ix_messages_session_id_id', 'messages')
+    with op.batch_alter_table('suggestions') as batch_op:
+        batch_op.drop_column('centroid')
+    with op.batch_alter_table('chatbots') as batch_op:
+        for column in reversed(CHATBOT_COLUMNS):
+            batch_op.drop_column(column.name)
@@ -1,7 +1,9 @@
 from easychatbot import create_app
 
 
-app = create_app()
+# the spawned normalization workers import this module again as __mp_main__, they only need the normalizer
+if __name__ != '__mp_main__':
+    app = create_app()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,10 @@
+from aiohttp import web
+from easychatbot import create_app
+from easychatbot.aio import create_aio_app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    web.run_app(create_aio_app(app), host='0.0.0.0', port=app.config['ASYNC_PORT'])
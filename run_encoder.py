@@ -0,0 +1,12 @@
+import os
+from config import configs
+from logger import create_logger
+from easychatbot.encoder_service import serve
+
+
+config_class = configs[os.getenv('FLASK_CONFIG', 'default')]
+config = {key: getattr(config_class, key) for key in dir(config_class) if key.isupper()}
+
+
+if __name__ == "__main__":
+    serve(config, create_logger(config))
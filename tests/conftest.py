@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import event
+from easychatbot import create_app
+from easychatbot.database import db
+from easychatbot.database.models import User, Chatbot
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    # the api and the user loader are registered on import, so the whole session shares one application
+    return create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'testing',
+        'DATA_PATH': str(tmp_path_factory.mktemp('data')),
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SQLALCHEMY_ECHO': False
+    })
+
+
+@pytest.fixture
+def chatbot(app):
+    with app.app_context():
+        chatbot = Chatbot(name='Test', match_threshold=0.7)
+        db.session.add(chatbot)
+        db.session.commit()
+        return chatbot.id
+
+
+@pytest.fixture
+def client(app, chatbot):
+    email = f'user{chatbot}@email.com'
+    with app.app_context():
+        db.session.add(User(email=email, password='password', user_name=f'user{chatbot}', chatbot_id=chatbot))
+        db.session.commit()
+
+    client = app.test_client()
+    response = client.post('/api/users/login', json={'email': email, 'password': 'password'})
+    assert response.status_code == 204
+    return client
+
+
+@pytest.fixture
+def queries(app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
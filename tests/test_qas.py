@@ -0,0 +1,58 @@
+import pytest
+from easychatbot.database import db
+from easychatbot.database.models import QA, Question, Answer
+
+
+def create_qas(app, chatbot_id, count):
+    with app.app_context():
+        qa_ids = []
+        for i in range(count):
+            qa = QA(chatbot_id=chatbot_id)
+            db.session.add(qa)
+            db.session.flush()
+            db.session.add_all([Question(chatbot_id=chatbot_id, qa_id=qa.id, text=f'Question {i}.{j}') for j in range(3)])
+            db.session.add_all([Answer(chatbot_id=chatbot_id, qa_id=qa.id, text=f'Answer {i}.{j}') for j in range(2)])
+            qa_ids.append(qa.id)
+        db.session.commit()
+        return qa_ids
+
+
+def count_listing_queries(client, queries, page_size):
+    queries.clear()
+    response = client.get(f'/api/qas/?page_size={page_size}')
+    assert response.status_code == 200
+    return len(queries), response.get_json()
+
+
+@pytest.mark.parametrize('count', [1, 25])
+def test_qa_listing_uses_a_fixed_number_of_queries(app, client, chatbot, queries, count):
+    qa_ids = create_qas(app, chatbot, count)
+
+    query_count, qas = count_listing_queries(client, queries, page_size=50)
+
+    # the user, the page of qa ids, their questions and their answers
+    assert query_count == 4
+    assert [qa['id'] for qa in qas] == qa_ids
+    assert all(len(qa['questions']) == 3 and len(qa['answers']) == 2 for qa in qas)
+    assert qas[-1]['questions'][0] == f'Question {count - 1}.0'
+
+
+def test_qa_listing_query_count_does_not_depend_on_the_page_size(app, client, chatbot, queries):
+    create_qas(app, chatbot, 30)
+
+    small, qas = count_listing_queries(client, queries, page_size=1)
+    assert len(qas) == 1
+    large, qas = count_listing_queries(client, queries, page_size=30)
+    assert len(qas) == 30
+    assert small == large
+
+
+def test_qa_detail_uses_a_fixed_number_of_queries(app, client, chatbot, queries):
+    qa_id, = create_qas(app, chatbot, 1)
+
+    queries.clear()
+    response = client.get(f'/api/qas/{qa_id}')
+
+    assert response.status_code == 200
+    assert response.get_json()['questions'] == ['Question 0.0', 'Question 0.1', 'Question 0.2']
+    assert len(queries) == 4